@@ -5,21 +5,38 @@ load_dotenv()
 import time
 import random
 import hashlib
+import hmac
+import json
+import logging
+import math
+import zlib
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from math import radians, sin, cos, sqrt, atan2
 
 import numpy as np
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-from sklearn.ensemble import IsolationForest
-
-# --- NEW: Twilio Imports ---
-from twilio.rest import Client
-from twilio.base.exceptions import TwilioRestException
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context
+from sqlalchemy import func, insert, select, text, update, and_, or_
 
 # Import database objects from the separate database.py file
-from database import db, Tourist, SafetyZone, Alert, Anomaly
+from database import db, Tourist, SafetyZone, Alert, Anomaly, LocationPing, EmergencyContact, ALERT_PANIC, ALERT_GEOFENCE, epoch_seconds
+import migrations
+import zone_index
+import tile_grid
+from location_history import PingBuffer
+from position_buffer import PositionBuffer, POSITION_COLUMNS
+from inactivity_scheduler import InactivityScheduler
+from trajectory_model import TrajectoryModel, build_features, SAFE_ZONE_SCORE
+from geo import haversine_np, bounding_box
+import dashboard_events
+import expiring_store
+import logs
+import metrics
+from notifications import Outbox, TwilioTransport, FakeTransport
 
 # --- App Configuration ---
+logs.configure()
+log = logs.get_logger('app')
+
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'your_super_secret_key')
 
@@ -28,7 +45,14 @@ DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///tourist_data.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
+metrics.instrument(app)
 
+# Location history is written in batches by a background flusher instead of per request
+ping_buffer = PingBuffer(
+    app,
+    batch_size=int(os.environ.get('PING_BATCH_SIZE', 500)),
+    flush_interval=float(os.environ.get('PING_FLUSH_INTERVAL', 2.0)),
+)
 
 
 # --- NEW: Twilio Configuration ---
@@ -37,60 +61,283 @@ db.init_app(app)
 TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER')
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
+# SMS go through a persistent outbox drained by background workers (see notifications.py).
+# SMS_TRANSPORT=fake records messages in memory instead of calling Twilio.
+if os.environ.get('SMS_TRANSPORT', 'twilio') == 'fake':
+    sms_transport = FakeTransport()
+else:
+    sms_transport = TwilioTransport(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER)
+outbox = Outbox(app, sms_transport, workers=int(os.environ.get('SMS_WORKERS', 4)))
+
+# Control-room numbers (comma-separated, E.164) told about every panic and geofence alert
+ALERT_NOTIFY_NUMBERS = [n.strip() for n in os.environ.get('ALERT_NOTIFY_NUMBERS', '').split(',') if n.strip()]
+PANIC_NOTIFY_DEDUPE = 60 # Seconds; repeated panic presses within this window notify each contact once
+
+
+# --- Dashboard Payloads (shared by the JSON endpoints and the event stream) ---
+TIMESTAMP_FORMAT = '%d-%b-%Y %H:%M:%S'
+
+# Dashboard event types behind each list endpoint (their newest event validates the response)
+TOURIST_EVENTS = ('tourist',)
+ALERT_EVENTS = ('alert',)
+ANOMALY_EVENTS = ('anomaly', 'anomalies_resolved')
+
+def tourist_payload(t):
+    return {'id': t.id, 'name': t.name, 'phone': t.phone, 'safety_score': t.safety_score, 'last_known_location': t.last_known_location}
+
+def alert_payload(a, tourist_name):
+    return {'id': a.id, 'tourist_id': a.tourist_id, 'tourist_name': tourist_name, 'alert_type': a.alert_type, 'category': a.category, 'location': a.location, 'timestamp': a.timestamp.strftime(TIMESTAMP_FORMAT)}
+
+def anomaly_payload(tourist_id, tourist_name, anomaly_type, description, timestamp):
+    return {'tourist_id': tourist_id, 'tourist_name': tourist_name, 'anomaly_type': anomaly_type, 'description': description, 'timestamp': timestamp.strftime(TIMESTAMP_FORMAT)}
 
 # --- AI Anomaly Detection Function ---
-def check_for_anomalies():
-    """Checks for tourists who have crossed inactivity time thresholds."""
-    with app.app_context():
+# Inactivity thresholds in seconds, overridable per deployment
+WARNING_THRESHOLD = int(os.environ.get('ANOMALY_WARNING_SECONDS', 600))    # 10 minutes
+CRITICAL_THRESHOLD = int(os.environ.get('ANOMALY_CRITICAL_SECONDS', 1200)) # 20 minutes
+ANOMALY_DEDUPE_WINDOW = int(os.environ.get('ANOMALY_DEDUPE_SECONDS', 600)) # No new anomaly within 10 minutes of the last
+
+ANOMALY_CHECK_SECONDS = metrics.Histogram('anomaly_check_duration_seconds', 'Duration of an inactivity anomaly pass.', ('scope',))
+ANOMALIES_LOGGED = metrics.Counter('anomalies_logged_total', 'Anomalies written, by level.', ('level',))
+
+ANOMALY_WRITE_LOCK_KEY = 727275 # Postgres advisory lock id; migrations use 727274
+_anomaly_write_lock = threading.Lock()
+
+@contextmanager
+def anomaly_write_lock():
+    """Serializes the "find unflagged tourists, then insert anomalies" passes.
+
+    Every gunicorn worker runs its own inactivity scheduler and fires the same
+    deadlines, so without this each of them would see the tourist as unflagged and
+    insert (and publish) its own copy. On Postgres the advisory lock is held by the
+    session's transaction until its commit or rollback, so the next pass only reads
+    once the previous one's anomalies are visible; elsewhere it covers the threads of
+    this process, which is the only concurrency SQLite deployments have.
+    """
+    with _anomaly_write_lock:
+        if db.session.get_bind().dialect.name == 'postgresql':
+            db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': ANOMALY_WRITE_LOCK_KEY})
+        try:
+            yield
+        finally:
+            db.session.rollback() # Ends the transaction (and the advisory lock) if the pass did not commit
+
+def inactive_tourists_query(now, warning_threshold, critical_threshold, dedupe_window, tourist_ids=None):
+    """Active tourists past the warning threshold that are not yet flagged for their current level."""
+    warning_cutoff = now - timedelta(seconds=warning_threshold)
+    critical_cutoff = now - timedelta(seconds=critical_threshold)
+
+    # Uncorrelated, so the database evaluates each once into a hashed set. Only inactivity
+    # anomalies count: other kinds (e.g. trajectory scoring's) must not hide a warning.
+    recent = and_(Anomaly.timestamp > now - timedelta(seconds=dedupe_window), Anomaly.anomaly_type.like('%Inactivity%'))
+    recently_flagged = db.session.query(Anomaly.tourist_id).filter(recent)
+    recently_critical = db.session.query(Anomaly.tourist_id).filter(recent, Anomaly.anomaly_type.like('Critical%'))
+    query = db.session.query(Tourist.id, Tourist.name, Tourist.last_updated_at).filter(
+        Tourist.visit_end_date > now,
+        Tourist.last_updated_at < warning_cutoff,
+        or_(
+            and_(Tourist.last_updated_at < critical_cutoff, Tourist.id.not_in(recently_critical)),
+            and_(Tourist.last_updated_at >= critical_cutoff, Tourist.id.not_in(recently_flagged)),
+        ),
+    )
+    if tourist_ids is not None:
+        query = query.filter(Tourist.id.in_(tourist_ids))
+    return query
+
+def check_for_anomalies(warning_threshold=None, critical_threshold=None, dedupe_window=None, tourist_ids=None):
+    """Logs anomalies for active tourists who have crossed inactivity time thresholds.
+
+    The whole pass is one SELECT of inactive tourists without a recent anomaly plus
+    one bulk INSERT, regardless of how many tourists are active. A recent warning does
+    not hold back escalation to critical. Pass tourist_ids to check only those tourists.
+    Runs under anomaly_write_lock(), so concurrent passes never log the same anomaly twice.
+    Returns a summary dict.
+    """
+    warning_threshold = WARNING_THRESHOLD if warning_threshold is None else warning_threshold
+    critical_threshold = CRITICAL_THRESHOLD if critical_threshold is None else critical_threshold
+    dedupe_window = ANOMALY_DEDUPE_WINDOW if dedupe_window is None else dedupe_window
+
+    scope = 'full' if tourist_ids is None else 'targeted'
+    with app.app_context(), ANOMALY_CHECK_SECONDS.time(scope=scope), anomaly_write_lock():
         now = datetime.utcnow()
-        active_tourists = Tourist.query.filter(Tourist.visit_end_date > now).all()
-
-        if not active_tourists:
-            return
-
-        print("\n" + "="*50)
-        print(f"Running Threshold Check at: {now.strftime('%Y-%m-%d %H:%M:%S')}")
-
-        # Define thresholds in seconds
-        CRITICAL_THRESHOLD = 1200 # 20 minutes
-        WARNING_THRESHOLD = 600   # 10 minutes
-
-        for tourist in active_tourists:
-            inactivity_seconds = (now - tourist.last_updated_at).total_seconds()
-            print(f"  - Checking {tourist.name}: Inactivity = {inactivity_seconds:.0f} seconds")
-
-            if inactivity_seconds > CRITICAL_THRESHOLD:
-                alert_type = "Critical Inactivity (20+ min)"
-                ten_minutes_ago = now - timedelta(minutes=10)
-                if not Anomaly.query.filter(Anomaly.tourist_id == tourist.id, Anomaly.timestamp > ten_minutes_ago).first():
-                    desc = f"Critical inactivity detected. Last update was {inactivity_seconds/60:.1f} minutes ago."
-                    db.session.add(Anomaly(tourist_id=tourist.id, anomaly_type=alert_type, description=desc))
-                    print(f"CRITICAL ANOMALY LOGGED for {tourist.name}")
-
-            elif inactivity_seconds > WARNING_THRESHOLD:
-                alert_type = "Warning Inactivity (10+ min)"
-                ten_minutes_ago = now - timedelta(minutes=10)
-                if not Anomaly.query.filter(Anomaly.tourist_id == tourist.id, Anomaly.timestamp > ten_minutes_ago).first():
-                    desc = f"Warning inactivity detected. Last update was {inactivity_seconds/60:.1f} minutes ago."
-                    db.session.add(Anomaly(tourist_id=tourist.id, anomaly_type=alert_type, description=desc))
-                    print(f"WARNING ANOMALY LOGGED for {tourist.name}")
-
-        print("="*50 + "\n")
+        critical_cutoff = now - timedelta(seconds=critical_threshold)
+        inactive = inactive_tourists_query(now, warning_threshold, critical_threshold, dedupe_window, tourist_ids).all()
+
+        new_anomalies, events = [], []
+        critical_count = 0
+        for tourist_id, name, last_updated_at in inactive:
+            minutes = (now - last_updated_at).total_seconds() / 60
+            if last_updated_at < critical_cutoff:
+                critical_count += 1
+                anomaly_type = f"Critical Inactivity ({critical_threshold // 60}+ min)"
+                desc = f"Critical inactivity detected. Last update was {minutes:.1f} minutes ago."
+            else:
+                anomaly_type = f"Warning Inactivity ({warning_threshold // 60}+ min)"
+                desc = f"Warning inactivity detected. Last update was {minutes:.1f} minutes ago."
+            new_anomalies.append({'tourist_id': tourist_id, 'anomaly_type': anomaly_type, 'description': desc,
+                                  'timestamp': now, 'status': 'active'})
+            events.append(anomaly_payload(tourist_id, name, anomaly_type, desc, now))
+
+        if new_anomalies:
+            db.session.execute(insert(Anomaly), new_anomalies)
+            dashboard_events.publish_many('anomaly', events)
         db.session.commit()
 
-# --- Helper Function for Distance ---
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371 # Earth radius in kilometers
-    lat1_rad, lon1_rad, lat2_rad, lon2_rad = map(radians, [lat1, lon1, lat2, lon2])
-    dlon, dlat = lon2_rad - lon1_rad, lat2_rad - lat1_rad
-    a = sin(dlat / 2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
+        summary = {
+            'checked_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'critical': critical_count,
+            'warning': len(new_anomalies) - critical_count,
+        }
+        ANOMALIES_LOGGED.inc(summary['critical'], level='critical')
+        ANOMALIES_LOGGED.inc(summary['warning'], level='warning')
+        # Most passes find nothing; those stay at debug so the log is not one line per tick
+        logs.log_event(log, logging.INFO if new_anomalies else logging.DEBUG, 'anomaly_check', scope=scope,
+                       critical=summary['critical'], warning=summary['warning'])
+        return summary
+
+# --- Deadline-driven inactivity detection ---
+MAX_TARGETED_CHECK = 1000 # Above this many due tourists a full pass is cheaper than an IN list
+
+def _check_due_tourists(tourist_ids):
+    if len(tourist_ids) > MAX_TARGETED_CHECK:
+        check_for_anomalies()
+    else:
+        check_for_anomalies(tourist_ids=tourist_ids)
+
+def _load_active_tourists():
+    with app.app_context():
+        return db.session.query(Tourist.id, Tourist.last_updated_at, Tourist.visit_end_date).filter(
+            Tourist.visit_end_date > datetime.utcnow()).all()
+
+inactivity_scheduler = InactivityScheduler(_check_due_tourists, _load_active_tourists, WARNING_THRESHOLD, CRITICAL_THRESHOLD)
+
+# --- Trajectory Anomaly Scoring (IsolationForest) ---
+TRAJECTORY_ANOMALY_TYPE = 'Unusual Movement Pattern'
+TRAJECTORY_WINDOW = int(os.environ.get('TRAJECTORY_WINDOW_SECONDS', 3600))            # Pings considered per run
+TRAJECTORY_SCORING_INTERVAL = int(os.environ.get('TRAJECTORY_SCORING_SECONDS', 300))  # Background run period
+TRAJECTORY_ANOMALY_TTL = int(os.environ.get('TRAJECTORY_ANOMALY_TTL_SECONDS', TRAJECTORY_WINDOW)) # Movement anomalies expire after this
+MIN_TRAJECTORY_PINGS = 3       # Tourists with fewer recent pings are not scored
+MIN_TRAINING_TOURISTS = 50     # Do not fit a model on less data than this
+PING_DTYPE = np.dtype([('tourist_id', np.int64), ('t', np.float64), ('latitude', np.float64), ('longitude', np.float64)])
+
+trajectory_model = TrajectoryModel(
+    os.environ.get('TRAJECTORY_MODEL_PATH', 'trajectory_model.joblib'),
+    contamination=float(os.environ.get('TRAJECTORY_CONTAMINATION', 0.01)),
+)
+TRAJECTORY_SCORING_SECONDS = metrics.Histogram('trajectory_scoring_duration_seconds', 'Duration of a trajectory scoring run.')
+
+def load_trajectory_pings(now):
+    """Active tourists' pings from the last TRAJECTORY_WINDOW, sorted by (tourist, time).
+
+    Returns parallel NumPy arrays (tourist ids, epoch seconds, latitudes, longitudes).
+    Rows stream from the cursor into one structured array, with the timestamp already
+    converted to epoch seconds by the database, so no per-ping Row list or datetime is
+    kept: an hour of 15-second pings is 240 rows per tourist.
+    """
+    stmt = select(
+        LocationPing.tourist_id, epoch_seconds(LocationPing.timestamp, db.engine.dialect.name),
+        LocationPing.latitude, LocationPing.longitude,
+    ).join(Tourist, Tourist.id == LocationPing.tourist_id).where(
+        LocationPing.timestamp >= now - timedelta(seconds=TRAJECTORY_WINDOW), Tourist.visit_end_date > now,
+    ).order_by(LocationPing.tourist_id, LocationPing.timestamp).execution_options(stream_results=True)
+    pings = np.fromiter(map(tuple, db.session.connection().execute(stmt)), dtype=PING_DTYPE)
+    return pings['tourist_id'], pings['t'], pings['latitude'], pings['longitude']
+
+def run_trajectory_scoring(refit=False):
+    """Scores every active tourist's recent trajectory in one IsolationForest call.
+
+    Loads recent pings in bulk, builds the feature matrix with NumPy, and writes an
+    Anomaly row for each outlier without an active or recent movement anomaly. Active
+    movement anomalies are resolved once their tourist scores as normal again, or after
+    TRAJECTORY_ANOMALY_TTL. The model is loaded from disk once per process and only
+    fitted when none exists or refit=True. Returns a summary dict.
+    """
+    with app.app_context(), TRAJECTORY_SCORING_SECONDS.time():
+        now = datetime.utcnow()
+        summary = {'checked_at': now.strftime('%Y-%m-%d %H:%M:%S'), 'scored': 0, 'outliers': 0, 'logged': 0, 'resolved': 0}
+        tourist_ids, epoch, lats, lons = load_trajectory_pings(now)
+        index = zone_index.get_index()
+        safe = index.scores > SAFE_ZONE_SCORE
+        ids, features = build_features(
+            tourist_ids, epoch, lats, lons,
+            index.latitudes[safe], index.longitudes[safe], index.radii[safe], min_pings=MIN_TRAJECTORY_PINGS,
+        )
+
+        scores = np.empty(0)
+        if len(ids):
+            if not trajectory_model.is_fitted and not refit:
+                trajectory_model.load()
+            if refit or not trajectory_model.is_fitted:
+                if len(ids) < MIN_TRAINING_TOURISTS:
+                    logs.log_event(log, logging.WARNING, 'trajectory_model_not_fitted', tourists=len(ids),
+                                   required=MIN_TRAINING_TOURISTS)
+                    return summary
+                trajectory_model.fit(features)
+            scores = trajectory_model.decision_function(features)
+        outliers = np.flatnonzero(scores < 0)
+        summary['scored'], summary['outliers'] = len(ids), len(outliers)
+
+        with anomaly_write_lock():
+            # Few rows: at most one active movement anomaly per tourist flagged in the last TTL
+            active = db.session.query(Anomaly.id, Anomaly.tourist_id, Anomaly.anomaly_type, Anomaly.timestamp).filter(
+                Anomaly.anomaly_type == TRAJECTORY_ANOMALY_TYPE, Anomaly.status == 'active').all()
+            normal = set(ids[scores >= 0].tolist())
+            expired = now - timedelta(seconds=TRAJECTORY_ANOMALY_TTL)
+            resolved = [a for a in active if a.timestamp <= expired or a.tourist_id in normal]
+            if resolved:
+                db.session.execute(update(Anomaly).where(Anomaly.id.in_([a.id for a in resolved])).values(status='resolved'))
+                dashboard_events.publish_many('anomalies_resolved', [
+                    {'tourist_id': a.tourist_id, 'anomaly_types': [a.anomaly_type]} for a in resolved])
 
-# --- In-memory OTP storage ---
-otp_storage = {}
+            resolved_ids = {a.id for a in resolved}
+            flagged = {a.tourist_id for a in active if a.id not in resolved_ids}
+            flagged.update(tourist_id for (tourist_id,) in db.session.query(Anomaly.tourist_id).filter(
+                Anomaly.anomaly_type == TRAJECTORY_ANOMALY_TYPE,
+                Anomaly.timestamp > now - timedelta(seconds=ANOMALY_DEDUPE_WINDOW),
+            ))
+            new_outliers = [i for i in outliers if int(ids[i]) not in flagged]
+            names = dict(db.session.query(Tourist.id, Tourist.name).filter(
+                Tourist.id.in_([int(ids[i]) for i in new_outliers]))) if new_outliers else {}
+            new_anomalies, events = [], []
+            for i in new_outliers:
+                tourist_id = int(ids[i])
+                mean_speed, max_speed, _, dwell, safe_distance = features[i]
+                desc = (f"Unusual movement (score {scores[i]:.3f}): avg {mean_speed:.1f} km/h, max {max_speed:.1f} km/h, "
+                        f"stationary {dwell / 60:.0f} min, {safe_distance:.1f} km from nearest safe zone.")
+                new_anomalies.append({'tourist_id': tourist_id, 'anomaly_type': TRAJECTORY_ANOMALY_TYPE,
+                                      'description': desc[:255], 'timestamp': now, 'status': 'active'})
+                events.append(anomaly_payload(tourist_id, names.get(tourist_id), TRAJECTORY_ANOMALY_TYPE, desc[:255], now))
+            if new_anomalies:
+                db.session.execute(insert(Anomaly), new_anomalies)
+                dashboard_events.publish_many('anomaly', events)
+            if new_anomalies or resolved:
+                db.session.commit()
+        summary['logged'], summary['resolved'] = len(new_anomalies), len(resolved)
+        ANOMALIES_LOGGED.inc(summary['logged'], level='trajectory')
+        logs.log_event(log, logging.INFO, 'trajectory_scoring', scored=summary['scored'], outliers=summary['outliers'],
+                       logged=summary['logged'], resolved=summary['resolved'])
+        return summary
+
+def trajectory_scoring_loop():
+    while True:
+        time.sleep(TRAJECTORY_SCORING_INTERVAL)
+        try:
+            run_trajectory_scoring()
+        except Exception as e:
+            logs.log_event(log, logging.ERROR, 'trajectory_scoring_failed', exc_info=e)
+
+# --- OTP Storage ---
+# Shared by every worker (see expiring_store); entries expire on their own
+OTP_TTL = int(os.environ.get('OTP_TTL_SECONDS', 300))
+OTP_SEND_LIMIT = int(os.environ.get('OTP_SEND_LIMIT', 5))                 # OTPs per phone per window
+OTP_SEND_WINDOW = int(os.environ.get('OTP_SEND_WINDOW_SECONDS', 900))
+OTP_MAX_ATTEMPTS = int(os.environ.get('OTP_MAX_ATTEMPTS', 5))             # Wrong guesses before the OTP is revoked
+otp_codes = expiring_store.create('otp', OTP_TTL)
+otp_sends = expiring_store.create('otp_sends', OTP_SEND_WINDOW)
+otp_attempts = expiring_store.create('otp_attempts', OTP_TTL)
+OTP_REQUESTS = metrics.Counter('otp_requests_total', 'OTP send requests, by outcome.', ('result',))
+OTP_VERIFICATIONS = metrics.Counter('otp_verifications_total', 'OTP verification attempts, by outcome.', ('result',))
 
 # --- HTML Page Routes ---
 @app.route('/')
@@ -127,24 +374,19 @@ def send_otp():
     if not phone.startswith('+'):
         return jsonify({'error': 'Phone number must be in E.164 format (e.g., +91xxxxxxxxxx).'}), 400
 
+    if otp_sends.incr(phone) > OTP_SEND_LIMIT:
+        OTP_REQUESTS.inc(result='rate_limited')
+        return jsonify({'error': 'Too many OTP requests. Please try again later.'}), 429
+
     otp = str(random.randint(100000, 999999))
-    otp_storage[phone] = {'otp': otp, 'timestamp': datetime.utcnow()}
-    
-    try:
-        message = twilio_client.messages.create(
-            body=f"Your Astra verification code is: {otp}",
-            from_=TWILIO_PHONE_NUMBER,
-            to=phone
-        )
-        print(f"OTP SMS sent to {phone} via Twilio. SID: {message.sid}")
-        return jsonify({'message': 'OTP sent successfully.'}), 200
-    except TwilioRestException as e:
-        print(f"Twilio Error: {e}")
-        # In case of error, you might not want to expose the exact Twilio error to the client.
-        return jsonify({'error': 'Failed to send OTP. Please check the phone number or server configuration.'}), 500
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        return jsonify({'error': 'An internal server error occurred.'}), 500
+    otp_codes.set(phone, otp)
+    otp_attempts.pop(phone)
+
+    # Delivered by the outbox workers; the request does not wait for Twilio
+    outbox.enqueue(phone, f"Your Astra verification code is: {otp}", 'otp')
+    db.session.commit()
+    OTP_REQUESTS.inc(result='sent')
+    return jsonify({'message': 'OTP sent successfully.'}), 200
 
 @app.route('/api/verify_otp', methods=['POST'])
 def verify_otp():
@@ -152,18 +394,27 @@ def verify_otp():
     phone = data.get('phone')
     otp_attempt = data.get('otp')
 
-    if phone not in otp_storage:
+    otp = otp_codes.get(phone) if phone else None
+    if otp is None:
+        OTP_VERIFICATIONS.inc(result='expired')
         return jsonify({'error': 'OTP not requested or has expired.'}), 404
 
-    otp_info = otp_storage[phone]
-    if datetime.utcnow() > otp_info['timestamp'] + timedelta(minutes=5):
-        del otp_storage[phone]
-        return jsonify({'error': 'OTP has expired.'}), 410
+    if otp_attempts.incr(phone) > OTP_MAX_ATTEMPTS:
+        otp_codes.pop(phone)
+        OTP_VERIFICATIONS.inc(result='locked')
+        return jsonify({'error': 'Too many incorrect attempts. Please request a new OTP.'}), 429
 
-    if otp_info['otp'] == otp_attempt:
-        del otp_storage[phone]
+    # Compared as bytes: compare_digest rejects str arguments with non-ASCII characters
+    if hmac.compare_digest(otp.encode(), str(otp_attempt or '').encode()):
+        # pop() is atomic, so a code can only be redeemed once even with concurrent requests
+        if otp_codes.pop(phone) is None:
+            OTP_VERIFICATIONS.inc(result='expired')
+            return jsonify({'error': 'OTP not requested or has expired.'}), 404
+        otp_attempts.pop(phone)
+        OTP_VERIFICATIONS.inc(result='verified')
         return jsonify({'message': 'OTP verified successfully.'}), 200
     else:
+        OTP_VERIFICATIONS.inc(result='invalid')
         return jsonify({'error': 'Invalid OTP.'}), 400
 
 @app.route('/api/login', methods=['POST'])
@@ -173,6 +424,8 @@ def login_user():
     tourist = Tourist.query.filter_by(phone=phone).first()
     if tourist:
         session['tourist_id'] = tourist.id
+        # Rows that never recorded an update count as inactive since registration
+        inactivity_scheduler.touch(tourist.id, tourist.last_updated_at or tourist.registration_date, tourist.visit_end_date)
         return jsonify({'message': 'Login successful'}), 200
     return jsonify({'error': 'Invalid phone number'}), 401
 
@@ -191,85 +444,560 @@ def register_user():
     unique_string = f"{data['name']}:{data['kyc_id']}:{datetime.utcnow()}"
     hex_dig = hashlib.sha256(unique_string.encode()).hexdigest()
     
+    contacts = data.get('emergency_contacts') or []
+    if not isinstance(contacts, list) or not all(
+            isinstance(c, dict) and isinstance(c.get('name', ''), (str, type(None))) for c in contacts):
+        return jsonify({'error': 'Emergency contacts must be a list of {"name", "phone"} objects.'}), 400
+    if any(not isinstance(c.get('phone'), str) or not c['phone'].startswith('+') for c in contacts):
+        return jsonify({'error': 'Emergency contact numbers must be in E.164 format (e.g., +91xxxxxxxxxx).'}), 400
+
     new_tourist = Tourist(digital_id=hex_dig, name=data['name'], phone=data['phone'], kyc_id=data['kyc_id'], kyc_type=data['kyc_type'], visit_end_date=end_date)
+    new_tourist.emergency_contacts = [EmergencyContact(name=c.get('name'), phone=c['phone']) for c in contacts]
     db.session.add(new_tourist)
+    db.session.flush()
+    dashboard_events.publish('tourist', tourist_payload(new_tourist))
     db.session.commit()
+    # Track the tourist from registration, so one who never sends a ping is still flagged
+    inactivity_scheduler.touch(new_tourist.id, new_tourist.last_updated_at, new_tourist.visit_end_date)
     
     session['tourist_id'] = new_tourist.id
     return jsonify({'message': 'Registration successful.'}), 201
 
+# --- Location Processing ---
+GEOFENCE_ALERT_COOLDOWN = timedelta(minutes=10)
+GEOFENCE_EVALUATIONS = metrics.Counter('geofence_evaluations_total', 'Location fixes evaluated against the safety zones.')
+GEOFENCE_CANDIDATES = metrics.Histogram('geofence_candidate_zones', 'Zones distance-checked per location fix.',
+                                        buckets=metrics.COUNT_BUCKETS)
+GEOFENCE_BREACHES = metrics.Counter('geofence_breaches_total', 'Geo-fence breach alerts raised.')
+MAX_BATCH_FIXES = 1000               # Largest offline backlog accepted in one batch upload
+MAX_BATCH_BODY_BYTES = 1024 * 1024   # Decompressed size limit for batch uploads
+
+# Optional write-behind mode (POSITION_WRITE_BEHIND=1): positions and scores are kept per
+# process and written in one bulk UPDATE every POSITION_FLUSH_INTERVAL_MS (see position_buffer.py)
+position_buffer = None
+if os.environ.get('POSITION_WRITE_BEHIND') == '1':
+    position_buffer = PositionBuffer(app, tourist_payload,
+                                     flush_interval=int(os.environ.get('POSITION_FLUSH_INTERVAL_MS', 500)) / 1000)
+
+def active_inactivity_anomalies_query(tourist_id):
+    # Served by ix_anomaly_tourist_status; the type check only filters the few rows it returns
+    return Anomaly.query.filter(Anomaly.tourist_id == tourist_id, Anomaly.status == 'active',
+                                Anomaly.anomaly_type.like('%Inactivity%'))
+
+def last_geofence_alert_query(tourist_id):
+    # Served by ix_alert_tourist_category_timestamp
+    return db.session.query(func.max(Alert.timestamp)).filter(
+        Alert.tourist_id == tourist_id, Alert.category == ALERT_GEOFENCE)
+
+def resolve_active_anomalies(tourist):
+    """Marks the tourist's active inactivity anomalies resolved now that they have checked in."""
+    active_anomalies = active_inactivity_anomalies_query(tourist.id).all()
+    if active_anomalies:
+        for anomaly in active_anomalies:
+            anomaly.status = 'resolved'
+        dashboard_events.publish('anomalies_resolved', {'tourist_id': tourist.id, 'anomaly_types': sorted({a.anomaly_type for a in active_anomalies})})
+        logs.log_event(log, logging.INFO, 'anomalies_resolved', sample_rate=logs.SAMPLE_RATE,
+                       tourist_id=tourist.id, count=len(active_anomalies))
+
+def apply_location_fixes(tourist, fixes):
+    """Runs geofence evaluation and safety-score updates over (timestamp, lat, lon) fixes in time order.
+
+    Adds any Geo-fence Breach alerts to the session and updates the tourist's score and
+    last known position; the caller commits, so a whole batch lands in one transaction.
+    Returns the number of alerts added.
+    """
+    index = zone_index.get_index()
+    last_breach_at, breach_loaded = None, False
+    alerts_added = 0
+
+    GEOFENCE_EVALUATIONS.inc(len(fixes))
+    for timestamp, lat, lon in fixes:
+        candidates = index.candidates(lat, lon)
+        GEOFENCE_CANDIDATES.observe(len(candidates))
+        hits = index.containing_indices(lat, lon, candidates)
+        if not hits.size:
+            continue
+        location = f"Lat: {lat}, Lon: {lon}"
+
+        if (index.scores[hits] < 40).any():
+            if not breach_loaded:
+                last_breach_at = last_geofence_alert_query(tourist.id).scalar()
+                breach_loaded = True
+            if last_breach_at is None or last_breach_at <= timestamp - GEOFENCE_ALERT_COOLDOWN:
+                zone = index.zones[hits[index.scores[hits] < 40][0]]
+                alert = Alert(tourist_id=tourist.id, location=location, timestamp=timestamp, category=ALERT_GEOFENCE,
+                              alert_type=f"Geo-fence Breach: Entered {zone.name}", cell=tile_grid.cell(lat, lon))
+                db.session.add(alert)
+                db.session.flush() # Assigns the id carried by the dashboard event
+                dashboard_events.publish('alert', alert_payload(alert, tourist.name))
+                for number in ALERT_NOTIFY_NUMBERS:
+                    outbox.enqueue(number, f"ASTRA: {tourist.name} entered {zone.name} at {location}.", 'geofence',
+                                   dedupe_key=f"geofence:{alert.id}:{number}", coalesce=True)
+                last_breach_at = timestamp
+                alerts_added += 1
+
+        current_zone_score = int(index.scores[hits].min())
+        if current_zone_score < tourist.safety_score:
+            tourist.safety_score = current_zone_score
+        elif current_zone_score > 80 and tourist.safety_score < 100:
+            tourist.safety_score = min(100, tourist.safety_score + 1)
+
+    if alerts_added:
+        GEOFENCE_BREACHES.inc(alerts_added)
+    timestamp, lat, lon = fixes[-1]
+    if tourist.last_updated_at is None or timestamp >= tourist.last_updated_at:
+        tourist.last_known_location = f"Lat: {lat}, Lon: {lon}"
+        tourist.last_latitude, tourist.last_longitude = lat, lon
+        tourist.cell = tile_grid.cell(lat, lon) # Keeps the map heatmap current without a separate pass
+        tourist.last_updated_at = timestamp
+    return alerts_added
+
+def read_batch_fixes():
+    """Parses a batch upload body into sorted (timestamp, lat, lon, accuracy) tuples.
+
+    The body is JSON, optionally gzip-compressed (Content-Encoding: gzip), of the form
+    {"fixes": [[epoch_ms, lat, lon, accuracy_or_null], ...]}. Raises ValueError on bad input.
+    """
+    body = request.get_data()
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = decompressor.decompress(body, MAX_BATCH_BODY_BYTES)
+        if decompressor.unconsumed_tail:
+            raise ValueError('Batch is too large.')
+    elif len(body) > MAX_BATCH_BODY_BYTES:
+        raise ValueError('Batch is too large.')
+
+    raw_fixes = json.loads(body).get('fixes')
+    if not isinstance(raw_fixes, list) or not raw_fixes:
+        raise ValueError('"fixes" must be a non-empty array.')
+    if len(raw_fixes) > MAX_BATCH_FIXES:
+        raise ValueError(f'At most {MAX_BATCH_FIXES} fixes are accepted per batch.')
+
+    now = datetime.utcnow()
+    fixes = []
+    for fix in raw_fixes:
+        if not isinstance(fix, list) or not 3 <= len(fix) <= 4:
+            raise ValueError('Each fix must be an array [epoch_ms, lat, lon, accuracy_or_null].')
+        epoch_ms, lat, lon = float(fix[0]), float(fix[1]), float(fix[2])
+        accuracy = float(fix[3]) if len(fix) > 3 and fix[3] is not None else None
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError('Coordinates out of range.')
+        # Clamp client clocks that run ahead of the server
+        timestamp = min(datetime.utcfromtimestamp(epoch_ms / 1000), now)
+        fixes.append((timestamp, lat, lon, accuracy))
+    fixes.sort(key=lambda f: f[0])
+    return fixes
+
 @app.route('/api/update_location', methods=['POST'])
 def update_location():
     if 'tourist_id' not in session: return jsonify({'error': 'Not authenticated'}), 401
     
     data = request.get_json()
     lat, lon = data.get('latitude'), data.get('longitude')
+    if position_buffer is not None:
+        state = update_location_write_behind(session['tourist_id'], [(datetime.utcnow(), lat, lon, data.get('accuracy'))])
+        if state is None: return jsonify({'error': 'Tourist not found'}), 404
+        return jsonify({'message': 'Location updated', 'safety_score': state.safety_score}), 200
+
     tourist = db.session.get(Tourist, session['tourist_id'])
     
     if not tourist: return jsonify({'error': 'Tourist not found'}), 404
 
-    active_anomalies = Anomaly.query.filter_by(tourist_id=tourist.id, status='active').all()
-    if active_anomalies:
-        for anomaly in active_anomalies:
-            anomaly.status = 'resolved'
-        print(f"Resolved {len(active_anomalies)} active anomalies for tourist {tourist.name}.")
-
-    tourist.last_known_location = f"Lat: {lat}, Lon: {lon}"
-    tourist.last_updated_at = datetime.utcnow()
-    
-    current_zone_score = None
-    for zone in SafetyZone.query.all():
-        if haversine(lat, lon, zone.latitude, zone.longitude) <= zone.radius:
-            if current_zone_score is None or zone.regional_score < current_zone_score:
-                current_zone_score = zone.regional_score
-
-            if zone.regional_score < 40:
-                ten_minutes_ago = datetime.utcnow() - timedelta(minutes=10)
-                if not Alert.query.filter(Alert.tourist_id == tourist.id, Alert.alert_type.like('%Geo-fence Breach%'), Alert.timestamp > ten_minutes_ago).first():
-                    db.session.add(Alert(tourist_id=tourist.id, location=tourist.last_known_location, alert_type=f"Geo-fence Breach: Entered {zone.name}"))
-
-    if current_zone_score is not None:
-        if current_zone_score < tourist.safety_score:
-            tourist.safety_score = current_zone_score
-        elif current_zone_score > 80 and tourist.safety_score < 100:
-            tourist.safety_score = min(100, tourist.safety_score + 1)
+    resolve_active_anomalies(tourist)
+    now = datetime.utcnow()
+    apply_location_fixes(tourist, [(now, lat, lon)])
+    ping_buffer.add(tourist.id, lat, lon, data.get('accuracy'), now)
+    dashboard_events.publish('tourist', tourist_payload(tourist))
 
     db.session.commit()
+    inactivity_scheduler.touch(tourist.id, tourist.last_updated_at, tourist.visit_end_date)
     return jsonify({'message': 'Location updated', 'safety_score': tourist.safety_score}), 200
 
+def update_location_write_behind(tourist_id, fixes):
+    """update_location for POSITION_WRITE_BEHIND mode: changes the cached tourist state and
+    leaves the Tourist row, anomaly resolution and the dashboard event to position_buffer's
+    next flush. Geofence alerts are still committed before returning. Returns the state,
+    or None if the tourist does not exist."""
+    state = position_buffer.state(tourist_id)
+    if state is None:
+        return None
+    with state.lock:
+        if apply_location_fixes(state, [(ts, lat, lon) for ts, lat, lon, _ in fixes]):
+            db.session.commit() # Geofence breach alerts (and their events and SMS) are not deferred
+        position_buffer.mark_dirty(state)
+    ping_buffer.extend([
+        {'tourist_id': tourist_id, 'timestamp': ts, 'latitude': lat, 'longitude': lon, 'accuracy': accuracy}
+        for ts, lat, lon, accuracy in fixes
+    ])
+    inactivity_scheduler.touch(tourist_id, state.last_updated_at, state.visit_end_date)
+    return state
+
+@app.route('/api/update_location/batch', methods=['POST'])
+def update_location_batch():
+    """Accepts fixes queued by a client while offline and processes them in one transaction."""
+    if 'tourist_id' not in session: return jsonify({'error': 'Not authenticated'}), 401
+
+    try:
+        fixes = read_batch_fixes()
+    except (ValueError, TypeError, IndexError, AttributeError, OverflowError, OSError, zlib.error) as e:
+        return jsonify({'error': f'Invalid batch: {e}'}), 400
+
+    if position_buffer is not None:
+        state = update_location_write_behind(session['tourist_id'], fixes)
+        if state is None: return jsonify({'error': 'Tourist not found'}), 404
+        return jsonify({'message': 'Locations updated', 'accepted': len(fixes), 'safety_score': state.safety_score}), 200
+
+    tourist = db.session.get(Tourist, session['tourist_id'])
+    if not tourist: return jsonify({'error': 'Tourist not found'}), 404
+
+    resolve_active_anomalies(tourist)
+    apply_location_fixes(tourist, [(ts, lat, lon) for ts, lat, lon, _ in fixes])
+    ping_buffer.extend([
+        {'tourist_id': tourist.id, 'timestamp': ts, 'latitude': lat, 'longitude': lon, 'accuracy': accuracy}
+        for ts, lat, lon, accuracy in fixes
+    ])
+    dashboard_events.publish('tourist', tourist_payload(tourist))
+
+    db.session.commit()
+    inactivity_scheduler.touch(tourist.id, tourist.last_updated_at, tourist.visit_end_date)
+    return jsonify({'message': 'Locations updated', 'accepted': len(fixes), 'safety_score': tourist.safety_score}), 200
+
 @app.route('/api/panic', methods=['POST'])
 def trigger_panic_alert():
     if 'tourist_id' not in session: return jsonify({'error': 'Not authenticated'}), 401
+    # The latest buffered position is written with the alert, never waiting on the flusher;
+    # the next update re-reads the zeroed score
+    buffered = position_buffer.take(session['tourist_id']) if position_buffer is not None else None
     tourist = db.session.get(Tourist, session['tourist_id'])
     if not tourist: return jsonify({'error': 'Tourist not found'}), 404
+    if buffered is not None:
+        with buffered.lock:
+            if buffered.last_updated_at and (tourist.last_updated_at is None or buffered.last_updated_at > tourist.last_updated_at):
+                for name in POSITION_COLUMNS:
+                    setattr(tourist, name, getattr(buffered, name))
+                resolve_active_anomalies(tourist)
     
-    new_alert = Alert(tourist_id=tourist.id, location=tourist.last_known_location, alert_type='Panic Button')
+    new_alert = Alert(tourist_id=tourist.id, location=tourist.last_known_location, alert_type='Panic Button', category=ALERT_PANIC,
+                      cell=tourist.cell)
     db.session.add(new_alert)
     tourist.safety_score = 0
+    db.session.flush()
+    dashboard_events.publish('alert', alert_payload(new_alert, tourist.name))
+    dashboard_events.publish('tourist', tourist_payload(tourist))
+    notify_panic(tourist)
     db.session.commit()
     
     return jsonify({'message': 'Panic alert successfully registered.'}), 200
 
+def notify_panic(tourist):
+    """Queues an SMS to the tourist's emergency contacts and the control room, in the caller's transaction."""
+    body = f"ASTRA EMERGENCY: {tourist.name} ({tourist.phone}) pressed the panic button. Last known location: {tourist.last_known_location}"
+    if tourist.last_latitude is not None:
+        body += f" https://maps.google.com/?q={tourist.last_latitude},{tourist.last_longitude}"
+    window = int(time.time() // PANIC_NOTIFY_DEDUPE)
+    numbers = [c.phone for c in tourist.emergency_contacts] + ALERT_NOTIFY_NUMBERS
+    for number in dict.fromkeys(numbers):
+        outbox.enqueue(number, body, 'panic', dedupe_key=f"panic:{tourist.id}:{number}:{window}")
+
 @app.route('/api/safety_zones')
 def get_safety_zones():
-    zones = SafetyZone.query.all()
-    return jsonify({'safety_zones': [{'name': z.name, 'latitude': z.latitude, 'longitude': z.longitude, 'radius': z.radius, 'regional_score': z.regional_score} for z in zones]})
+    """Served from the in-memory zone snapshot: pre-serialized, gzipped when accepted, with a strong ETag."""
+    snapshot = zone_index.get_index()
+    use_gzip = request.accept_encodings['gzip'] > 0
+    etag = snapshot.etag + ('-gz' if use_gzip else '') # Each encoding is a distinct representation
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(snapshot.gzip_body if use_gzip else snapshot.json_body, mimetype='application/json')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# --- Dashboard Query Helpers ---
+def dashboard_limit(default, maximum):
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, maximum))
+
+def parse_bbox(value):
+    """Parses 'min_lat,min_lon,max_lat,max_lon' into floats."""
+    parts = [float(p) for p in value.split(',')]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError('bbox must be min_lat,min_lon,max_lat,max_lon.')
+    return parts
+
+def encode_cursor(timestamp, row_id):
+    return f"{timestamp.isoformat()}_{row_id}"
+
+def decode_cursor(cursor):
+    try:
+        timestamp, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise ValueError('Invalid cursor.') from None
+
+def keyset_before(model, cursor):
+    """Filter for rows after `cursor` in (timestamp DESC, id DESC) order."""
+    timestamp, row_id = decode_cursor(cursor)
+    return or_(model.timestamp < timestamp, and_(model.timestamp == timestamp, model.id < row_id))
+
+def conditional_json(build, event_types, time_sensitive=False):
+    """Returns build()'s JSON, or 304 if nothing has changed since the client's copy.
+
+    Every dashboard-visible write publishes a dashboard event, and each event type has a
+    change counter bumped in the same transaction, so the counters of the types this
+    response shows are a cheap validator: the ETag is derived from them without running
+    the real query, and writes the response does not show (e.g. location pings, for the
+    alert list) leave it valid. The counters never go back, even once old events are
+    pruned, so an ETag is never handed out twice for different data. No Last-Modified is
+    sent: one-second resolution cannot tell apart changes made within the same second.
+    time_sensitive responses (those filtering on visit status) also depend on how many
+    visits have ended.
+    """
+    counters = ','.join(map(str, dashboard_events.versions(event_types)))
+    validator = f"{counters}:{request.full_path}"
+    if time_sensitive:
+        validator += f":{Tourist.query.filter(Tourist.visit_end_date <= datetime.utcnow()).count()}"
+    etag = hashlib.sha1(validator.encode()).hexdigest()
+
+    response = Response(status=304) if request.if_none_match.contains(etag) else jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/dashboard/tourists')
 def get_tourists_data():
-    tourists = Tourist.query.all()
-    return jsonify({'tourists': [{'id': t.id, 'name': t.name, 'phone': t.phone, 'safety_score': t.safety_score, 'last_known_location': t.last_known_location} for t in tourists]})
+    """Tourists ordered by id, one page at a time.
+
+    Query parameters: cursor (next_cursor from the previous page), limit,
+    min_score, max_score, status ('active' or 'expired'), bbox (min_lat,min_lon,max_lat,max_lon).
+    """
+    try:
+        limit = dashboard_limit(500, 2000)
+        cursor = request.args.get('cursor', type=int)
+        min_score = request.args.get('min_score', type=int)
+        max_score = request.args.get('max_score', type=int)
+        status = request.args.get('status')
+        bbox = parse_bbox(request.args['bbox']) if 'bbox' in request.args else None
+        if status not in (None, 'active', 'expired'):
+            raise ValueError("status must be 'active' or 'expired'.")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build():
+        query = Tourist.query.order_by(Tourist.id)
+        if cursor is not None:
+            query = query.filter(Tourist.id > cursor)
+        if min_score is not None:
+            query = query.filter(Tourist.safety_score >= min_score)
+        if max_score is not None:
+            query = query.filter(Tourist.safety_score <= max_score)
+        if status == 'active':
+            query = query.filter(Tourist.visit_end_date > datetime.utcnow())
+        elif status == 'expired':
+            query = query.filter(Tourist.visit_end_date <= datetime.utcnow())
+        if bbox:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            # A few cell ranges around the box narrow the rows through ix_tourist_cell; the box is then exact
+            cells = [Tourist.cell.between(first, last) for first, last in tile_grid.box_ranges(*bbox)]
+            query = query.filter(or_(*cells), Tourist.last_latitude.between(min_lat, max_lat),
+                                 Tourist.last_longitude.between(min_lon, max_lon))
+        tourists = query.limit(limit + 1).all()
+        next_cursor = tourists[limit - 1].id if len(tourists) > limit else None
+        return {'tourists': [tourist_payload(t) for t in tourists[:limit]], 'next_cursor': next_cursor}
+
+    return conditional_json(build, TOURIST_EVENTS, time_sensitive=status is not None)
 
 @app.route('/api/dashboard/alerts')
 def get_alerts_data():
-    alerts = Alert.query.order_by(Alert.timestamp.desc()).limit(50).all()
-    return jsonify({'alerts': [{'tourist_name': a.tourist.name, 'alert_type': a.alert_type, 'location': a.location, 'timestamp': a.timestamp.strftime('%d-%b-%Y %H:%M:%S')} for a in alerts]})
+    """Newest alerts first. Query parameters: cursor, limit, tourist_id, category, alert_type (prefix)."""
+    try:
+        limit = dashboard_limit(50, 500)
+        cursor = request.args.get('cursor')
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    tourist_id = request.args.get('tourist_id', type=int)
+    category = request.args.get('category')
+    alert_type = request.args.get('alert_type')
+
+    def build():
+        # Tourist names come from the same query instead of one lazy load per row
+        query = db.session.query(Alert, Tourist.name).join(Tourist, Alert.tourist_id == Tourist.id).order_by(Alert.timestamp.desc(), Alert.id.desc())
+        if cursor:
+            query = query.filter(keyset_before(Alert, cursor))
+        if tourist_id is not None:
+            query = query.filter(Alert.tourist_id == tourist_id)
+        if category:
+            query = query.filter(Alert.category == category)
+        if alert_type:
+            query = query.filter(Alert.alert_type.startswith(alert_type, autoescape=True))
+        rows = query.limit(limit + 1).all()
+        next_cursor = encode_cursor(rows[limit - 1][0].timestamp, rows[limit - 1][0].id) if len(rows) > limit else None
+        return {'alerts': [alert_payload(a, name) for a, name in rows[:limit]], 'next_cursor': next_cursor}
+
+    return conditional_json(build, ALERT_EVENTS)
 
 @app.route('/api/dashboard/anomalies')
 def get_anomalies_data():
-    anomalies = Anomaly.query.filter_by(status='active').order_by(Anomaly.timestamp.desc()).limit(50).all()
-    result = [{'tourist_name': a.tourist.name, 'anomaly_type': a.anomaly_type, 'description': a.description, 'timestamp': a.timestamp.strftime('%d-%b-%Y %H:%M:%S')} for a in anomalies]
-    return jsonify({'anomalies': result})
+    """Newest anomalies first. Query parameters: cursor, limit, tourist_id, status ('active', 'resolved' or 'all')."""
+    try:
+        limit = dashboard_limit(50, 500)
+        cursor = request.args.get('cursor')
+        if cursor:
+            decode_cursor(cursor)
+        status = request.args.get('status', 'active')
+        if status not in ('active', 'resolved', 'all'):
+            raise ValueError("status must be 'active', 'resolved' or 'all'.")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    tourist_id = request.args.get('tourist_id', type=int)
+
+    def build():
+        query = db.session.query(Anomaly, Tourist.name).join(Tourist, Anomaly.tourist_id == Tourist.id).order_by(Anomaly.timestamp.desc(), Anomaly.id.desc())
+        if status != 'all':
+            query = query.filter(Anomaly.status == status)
+        if cursor:
+            query = query.filter(keyset_before(Anomaly, cursor))
+        if tourist_id is not None:
+            query = query.filter(Anomaly.tourist_id == tourist_id)
+        rows = query.limit(limit + 1).all()
+        next_cursor = encode_cursor(rows[limit - 1][0].timestamp, rows[limit - 1][0].id) if len(rows) > limit else None
+        result = [anomaly_payload(a.tourist_id, name, a.anomaly_type, a.description, a.timestamp) for a, name in rows[:limit]]
+        return {'anomalies': result, 'next_cursor': next_cursor}
+
+    return conditional_json(build, ANOMALY_EVENTS)
+
+# --- Map Heatmap Tiles ---
+# Tourist and alert rows carry their map cell (see tile_grid.py), kept current by every
+# location update, so a tile is aggregated with one index range scan per table. Tiles are
+# cached per process for HEATMAP_TILE_TTL seconds; the map refreshes on a similar period.
+HEATMAP_TILE_TTL = float(os.environ.get('HEATMAP_TILE_TTL_SECONDS', 5))
+HEATMAP_ALERT_WINDOW = int(os.environ.get('HEATMAP_ALERT_WINDOW_SECONDS', 86400)) # Alerts counted on the map
+heatmap_tiles = expiring_store.MemoryStore('heatmap_tiles', HEATMAP_TILE_TTL,
+                                           max_entries=int(os.environ.get('HEATMAP_CACHE_TILES', 5000)))
+HEATMAP_TILE_REQUESTS = metrics.Counter('heatmap_tile_requests_total', 'Heatmap tiles served, by cache result.', ('cache',))
+
+def heatmap_tile(z, x, y):
+    """Aggregates active tourists and recent alerts under tile z/x/y into bins.
+
+    Returns parallel arrays over the non-empty bins, numbered row by row from the tile's
+    top-left corner on a `size` x `size` grid: tourists (count), min_score (lowest safety
+    score, None where there are only alerts) and alerts (count in HEATMAP_ALERT_WINDOW).
+    """
+    first, last = tile_grid.tile_range(z, x, y)
+    shift = tile_grid.bin_shift(z)
+    now = datetime.utcnow()
+    tourist_bin = Tourist.cell.op('>>')(shift)
+    tourists = db.session.query(tourist_bin, func.count(Tourist.id), func.min(Tourist.safety_score)).filter(
+        Tourist.cell.between(first, last), Tourist.visit_end_date > now).group_by(tourist_bin)
+    alert_bin = Alert.cell.op('>>')(shift)
+    alerts = db.session.query(alert_bin, func.count(Alert.id)).filter(
+        Alert.cell.between(first, last), Alert.timestamp > now - timedelta(seconds=HEATMAP_ALERT_WINDOW)).group_by(alert_bin)
+
+    bins = {}
+    for code, count, min_score in tourists:
+        bins[tile_grid.bin_index(z, x, y, code)] = [count, min_score, 0]
+    for code, count in alerts:
+        bins.setdefault(tile_grid.bin_index(z, x, y, code), [0, None, 0])[2] = count
+    order = sorted(bins)
+    return {
+        'z': z, 'x': x, 'y': y, 'size': 1 << (tile_grid.bin_zoom(z) - z), 'bins': order,
+        'tourists': [bins[i][0] for i in order],
+        'min_score': [bins[i][1] for i in order],
+        'alerts': [bins[i][2] for i in order],
+    }
+
+@app.route('/api/dashboard/heatmap/<int:z>/<int:x>/<int:y>')
+def get_heatmap_tile(z, x, y):
+    """Tourist density and alert counts for one slippy-map tile, as compact arrays (see heatmap_tile)."""
+    if not tile_grid.valid_tile(z, x, y):
+        return jsonify({'error': 'No such tile.'}), 404
+    key = (z, x, y)
+    cached = heatmap_tiles.get(key)
+    HEATMAP_TILE_REQUESTS.inc(cache='miss' if cached is None else 'hit')
+    if cached is None:
+        body = json.dumps(heatmap_tile(z, x, y), separators=(',', ':'))
+        cached = (body, hashlib.sha1(body.encode()).hexdigest())
+        heatmap_tiles.set(key, cached)
+    body, etag = cached
+    response = Response(status=304) if request.if_none_match.contains(etag) else Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/dashboard/stream')
+def stream_dashboard_events():
+    """Server-Sent Events feed of dashboard changes (alert, anomaly, anomalies_resolved, tourist).
+
+    Each event's id is its sequence number. Reconnecting clients resume from the
+    Last-Event-ID header (or ?since=); a `resync` event asks them to reload full state.
+    A connection occupies its request handler for up to STREAM_LIFETIME, so this needs
+    threaded (or async) workers; gunicorn.conf.py sets them, never run it with sync workers.
+    """
+    last_seq = request.headers.get('Last-Event-ID') or request.args.get('since')
+    last_seq = int(last_seq) if last_seq and last_seq.isdigit() else None
+    return Response(stream_with_context(dashboard_events.stream(last_seq)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/dashboard/tourists_near')
+def get_tourists_near():
+    """Lists active tourists within radius_km of an incident location, nearest first."""
+    try:
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+        radius_km = float(request.args.get('radius_km', 5))
+    except (KeyError, ValueError):
+        return jsonify({'error': 'lat and lon (and optionally radius_km) must be numbers.'}), 400
+
+    # A cheap bounding-box filter in SQL, then one vectorized exact distance pass
+    min_lat, min_lon, max_lat, max_lon = bounding_box(lat, lon, radius_km)
+    query = db.session.query(
+        Tourist.id, Tourist.name, Tourist.phone, Tourist.safety_score,
+        Tourist.last_latitude, Tourist.last_longitude,
+    ).filter(
+        Tourist.visit_end_date > datetime.utcnow(),
+        Tourist.last_latitude.between(min_lat, max_lat),
+    )
+    if min_lon >= -180 and max_lon <= 180:
+        query = query.filter(Tourist.last_longitude.between(min_lon, max_lon))
+    rows = query.all()
+    if not rows:
+        return jsonify({'tourists': []})
+
+    coords = np.array([(r.last_latitude, r.last_longitude) for r in rows], dtype=float)
+    distances = haversine_np(lat, lon, coords[:, 0], coords[:, 1])
+    nearby = np.flatnonzero(distances <= radius_km)
+    nearby = nearby[np.argsort(distances[nearby])]
+    return jsonify({'tourists': [
+        {'id': rows[i].id, 'name': rows[i].name, 'phone': rows[i].phone, 'safety_score': rows[i].safety_score,
+         'latitude': rows[i].last_latitude, 'longitude': rows[i].last_longitude, 'distance_km': round(float(distances[i]), 3)}
+        for i in nearby
+    ]})
+
+MAX_HISTORY_HOURS = int(os.environ.get('MAX_HISTORY_HOURS', 7 * 24)) # Longest trajectory replay served at once
+
+@app.route('/api/dashboard/tourists/<int:tourist_id>/history')
+def get_tourist_history(tourist_id):
+    """Returns a tourist's recorded fixes as parallel arrays, oldest first, for trajectory replay."""
+    hours = request.args.get('hours', 24, type=float)
+    if not (hours > 0 and math.isfinite(hours)):
+        return jsonify({'error': 'hours must be a positive number.'}), 400
+    since = datetime.utcnow() - timedelta(hours=min(hours, MAX_HISTORY_HOURS))
+    pings = db.session.query(
+        LocationPing.timestamp, LocationPing.latitude, LocationPing.longitude, LocationPing.accuracy,
+    ).filter(LocationPing.tourist_id == tourist_id, LocationPing.timestamp >= since).order_by(LocationPing.timestamp).all()
+    return jsonify({
+        'tourist_id': tourist_id,
+        'timestamps': [p.timestamp.isoformat() for p in pings],
+        'latitudes': [p.latitude for p in pings],
+        'longitudes': [p.longitude for p in pings],
+        'accuracies': [p.accuracy for p in pings],
+    })
 
 def add_initial_data():
     """Adds a comprehensive list of initial safety zones for India."""
@@ -324,13 +1052,48 @@ def add_initial_data():
                 SafetyZone(name='Puri Beach, Odisha', latitude=19.8055, longitude=85.8275, radius=50, regional_score=70)
             ])
             db.session.commit()
-            print("Added comprehensive initial safety zones for India.")
+            zone_index.invalidate()
+            logs.log_event(log, logging.INFO, 'initial_safety_zones_added', count=SafetyZone.query.count())
 
 # --- Deployment-Ready Additions ---
-with app.app_context():
-    db.create_all()
+# Importing the app does no database work. The schema and seed data are set up by
+# `flask init-db` (run once per deploy), or otherwise once per process before the
+# first request / by run_server(). Set AUTO_INIT_DB=0 when init-db is part of the deploy.
+AUTO_INIT_DB = os.environ.get('AUTO_INIT_DB', '1') == '1'
+_db_ready = False
+_db_ready_lock = threading.Lock()
+
+def init_db():
+    """Applies pending migrations and adds the initial safety zones if there are none."""
+    with app.app_context():
+        migrations.upgrade()
     add_initial_data()
 
+def ensure_db():
+    """Runs init_db() once per process; later calls return immediately."""
+    global _db_ready
+    if _db_ready:
+        return
+    with _db_ready_lock:
+        if not _db_ready:
+            init_db()
+            _db_ready = True
+
+@app.before_request
+def _ensure_db_before_first_request():
+    if AUTO_INIT_DB and not _db_ready:
+        ensure_db()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Applies pending schema migrations and seeds the initial safety zones."""
+    init_db()
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Applies pending schema migrations."""
+    migrations.upgrade()
+
 # Endpoint for external cron job to call
 @app.route('/cron/run-anomaly-check/<secret_key>')
 def run_anomaly_check_cron(secret_key):
@@ -340,26 +1103,58 @@ def run_anomaly_check_cron(secret_key):
     if not cron_secret or secret_key != cron_secret:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    check_for_anomalies()
-    return jsonify({'message': 'Anomaly check successfully initiated.'}), 200
+    summary = check_for_anomalies()
+    return jsonify({'message': 'Anomaly check completed.', 'summary': summary}), 200
+
+@app.route('/cron/run-trajectory-scoring/<secret_key>')
+def run_trajectory_scoring_cron(secret_key):
+    cron_secret = os.environ.get('CRON_SECRET_KEY')
+    if not cron_secret or secret_key != cron_secret:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    summary = run_trajectory_scoring(refit=request.args.get('refit') == '1')
+    return jsonify({'message': 'Trajectory scoring completed.', 'summary': summary}), 200
+
+@app.route('/cron/drain-outbox/<secret_key>')
+def drain_outbox_cron(secret_key):
+    cron_secret = os.environ.get('CRON_SECRET_KEY')
+    if not cron_secret or secret_key != cron_secret:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    settled = outbox.drain()
+    return jsonify({'message': 'Outbox drained.', 'settled': settled, 'pending': outbox.pending_count()}), 200
+
+# --- Metrics ---
+# Queue depths are read at scrape time. Values are per process: under gunicorn, scrape each worker.
+metrics.Gauge('sms_outbox_pending', 'Outbox messages not yet settled (shared by all workers).', ('kind',),
+              callback=outbox.pending_by_kind)
+metrics.Gauge('ping_buffer_pending', 'Location pings waiting to be written.', callback=lambda: len(ping_buffer))
+metrics.Gauge('position_buffer_dirty', 'Tourists with buffered position updates.',
+              callback=lambda: len(position_buffer) if position_buffer is not None else 0)
+metrics.Gauge('inactivity_scheduler_entries', 'Deadlines held by the inactivity scheduler.',
+              callback=lambda: len(inactivity_scheduler))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Optional bearer token (METRICS_TOKEN) for deployments where /metrics is publicly reachable
+    token = os.environ.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 # --- NEW FUNCTION TO RUN THE SERVER ---
 def run_server():
     """Function to run the Flask app, callable from another script."""
+    ensure_db()
+    inactivity_scheduler.start()
+    outbox.start()
+    threading.Thread(target=trajectory_scoring_loop, daemon=True).start()
     # NOTE: debug=False is recommended when packaging
     app.run(host='0.0.0.0', port=5000, debug=False)
 
 
 # This block is for local development only.
+# Inactivity detection runs from the deadline scheduler started by run_server();
+# /cron/run-anomaly-check remains available as a full-scan safety net.
 if __name__ == '__main__':
-    def anomaly_checker_loop():
-        while True:
-            with app.app_context():
-                check_for_anomalies()
-            time.sleep(300) # Run every 5 minutes
-
-    anomaly_thread = threading.Thread(target=anomaly_checker_loop, daemon=True)
-    anomaly_thread.start()
-    
-    # Call the new run function
     run_server()
\ No newline at end of file
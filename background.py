@@ -0,0 +1,26 @@
+"""Per-process start-up for the background threads behind the buffers and the outbox."""
+import os
+import threading
+
+
+class PerProcessStart:
+    """Calls `start` once in each process, the first time ensure() runs there.
+
+    Threads do not survive os.fork(), so anything that runs a background thread starts
+    it lazily through this: each gunicorn worker gets its own on first use, and
+    ensure() is a single pid comparison after that.
+    """
+
+    def __init__(self, start):
+        self._start = start
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._start()
@@ -0,0 +1,76 @@
+"""Times check_for_anomalies() and counts its SQL statements as the active fleet grows.
+
+Runs against a throwaway SQLite database unless DATABASE_URL is set.
+
+Usage: python benchmarks/bench_anomaly_check.py [--sizes 1000,10000,100000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='astra-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+
+from sqlalchemy import event, insert
+
+from app import app, check_for_anomalies, init_db
+from database import db, Tourist, Anomaly
+from fleet import tourist_rows
+
+
+def seed(count, rng):
+    """Replaces all tourists with `count` active ones, a third of them idle past each threshold."""
+    now = datetime.utcnow()
+    db.session.query(Anomaly).delete()
+    db.session.query(Tourist).delete()
+    rows = tourist_rows(count, rng, 'bench', now=now)
+    for row in rows:
+        idle_minutes = rng.choice((rng.uniform(0, 9), rng.uniform(11, 19), rng.uniform(21, 120)))
+        row['last_updated_at'] = now - timedelta(minutes=idle_minutes)
+    db.session.execute(insert(Tourist), rows)
+    db.session.commit()
+
+
+def measure():
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        start = time.perf_counter()
+        summary = check_for_anomalies()
+        elapsed = time.perf_counter() - start
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+    return elapsed, len(statements), summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    init_db()
+    with app.app_context():
+        for size in (int(s) for s in args.sizes.split(',')):
+            seed(size, rng)
+            first = measure()
+            # A second pass finds nothing new: every idle tourist now has a recent anomaly
+            second = measure()
+            for label, (elapsed, queries, summary) in (('first pass', first), ('repeat pass', second)):
+                print(f"{size:>7} tourists | {label:<11} | {elapsed * 1000:9.1f} ms | {queries} SQL statements | "
+                      f"{summary['critical']} critical, {summary['warning']} warning")
+
+
+if __name__ == '__main__':
+    main()
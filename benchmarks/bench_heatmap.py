@@ -0,0 +1,118 @@
+"""Compares the dashboard map's payload as the fleet grows: every tourist as a marker vs heatmap tiles.
+
+For each fleet size, seeds tourists (and twice as many recent alerts) at random
+positions over India, then measures:
+  markers  paging through /api/dashboard/tourists, as the map did to plot every tourist
+  heatmap  the /api/dashboard/heatmap tiles covering India at --zoom, cold (empty tile
+           cache) and warm, with the SQL statements issued per tile
+Runs against a throwaway SQLite database unless DATABASE_URL is set.
+
+Usage: python benchmarks/bench_heatmap.py [--sizes 1000,10000,100000] [--zoom 5]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='astra-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'heatmap.db')}")
+os.environ.setdefault('SMS_TRANSPORT', 'fake')
+
+from sqlalchemy import event, insert
+
+import tile_grid
+import app as astra
+from database import db, Tourist, Alert, ALERT_GEOFENCE
+from fleet import LAT_RANGE, LON_RANGE, tourist_rows
+
+INSERT_CHUNK = 10000
+
+
+def seed(count, rng):
+    now = datetime.utcnow()
+    Alert.query.delete()
+    Tourist.query.delete()
+    rows = tourist_rows(count, rng, 'heat', now=now)
+    for row in rows:
+        row['safety_score'] = rng.randint(0, 100)
+    positions = [(row['last_latitude'], row['last_longitude']) for row in rows]
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(insert(Tourist), rows[start:start + INSERT_CHUNK])
+    ids = [tid for (tid,) in db.session.query(Tourist.id)]
+    alerts = []
+    for _ in range(count * 2):
+        lat, lon = rng.choice(positions)
+        alerts.append({'tourist_id': rng.choice(ids), 'location': f'Lat: {lat}, Lon: {lon}', 'category': ALERT_GEOFENCE,
+                       'alert_type': 'Geo-fence Breach', 'cell': tile_grid.cell(lat, lon),
+                       'timestamp': now - timedelta(hours=rng.uniform(0, 20))})
+    for start in range(0, len(alerts), INSERT_CHUNK):
+        db.session.execute(insert(Alert), alerts[start:start + INSERT_CHUNK])
+    db.session.commit()
+
+
+def viewport_tiles(zoom):
+    x0, y0 = tile_grid.tile_xy(LAT_RANGE[1], LON_RANGE[0], zoom) # Top-left
+    x1, y1 = tile_grid.tile_xy(LAT_RANGE[0], LON_RANGE[1], zoom) # Bottom-right
+    return [(zoom, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def fetch_markers(client):
+    total_bytes, requests, cursor = 0, 0, None
+    start = time.perf_counter()
+    while True:
+        response = client.get('/api/dashboard/tourists?limit=2000' + (f'&cursor={cursor}' if cursor else ''))
+        total_bytes += len(response.data)
+        requests += 1
+        cursor = response.get_json()['next_cursor']
+        if cursor is None:
+            return total_bytes, requests, time.perf_counter() - start
+
+
+def fetch_tiles(client, tiles):
+    total_bytes = 0
+    start = time.perf_counter()
+    for z, x, y in tiles:
+        total_bytes += len(client.get(f'/api/dashboard/heatmap/{z}/{x}/{y}').data)
+    return total_bytes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--zoom', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    tiles = viewport_tiles(args.zoom)
+    astra.init_db()
+    client = astra.app.test_client()
+    statements = {'count': 0}
+
+    def count_statement(*_):
+        statements['count'] += 1
+
+    print(f"Heatmap viewport: {len(tiles)} tiles at zoom {args.zoom}")
+    with astra.app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', count_statement)
+        for size in (int(s) for s in args.sizes.split(',')):
+            seed(size, rng)
+            marker_bytes, marker_requests, marker_time = fetch_markers(client)
+            astra.heatmap_tiles = astra.expiring_store.MemoryStore('heatmap_tiles', astra.HEATMAP_TILE_TTL)
+            statements['count'] = 0
+            cold_bytes, cold_time = fetch_tiles(client, tiles)
+            cold_statements = statements['count']
+            _, warm_time = fetch_tiles(client, tiles)
+            print(f"{size:>7} tourists | markers {marker_bytes / 1024:9.1f} KiB in {marker_requests:3} requests, "
+                  f"{marker_time * 1000:7.1f} ms | heatmap {cold_bytes / 1024:6.1f} KiB, cold {cold_time * 1000:6.1f} ms "
+                  f"({cold_statements / len(tiles):.1f} statements/tile), warm {warm_time * 1000:5.1f} ms")
+        event.remove(db.engine, 'before_cursor_execute', count_statement)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Measures how long `import app` takes in a fresh interpreter, as web.py and every gunicorn worker pay it.
+
+Each run starts a new Python process against a throwaway SQLite path and reports the
+wall-clock import time, the slowest top-level imports (from `python -X importtime`),
+and two startup invariants: importing the app must not touch the database, and must
+not load the modules that are only needed later (scikit-learn, joblib, twilio).
+Exits with status 1 if an invariant breaks or the median exceeds --max-seconds, so it
+can guard the packaged APK's startup in CI.
+
+Usage: python benchmarks/bench_import.py [--runs 5] [--top 10] [--max-seconds 1.5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use (model scoring, SMS delivery), never at import
+LAZY_MODULES = ('sklearn', 'joblib', 'twilio')
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': sorted(m for m in %r if m in sys.modules)}))
+""" % (LAZY_MODULES,)
+
+
+def probe(env, importtime=False):
+    cmd = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', PROBE]
+    result = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(importtime_log, top):
+    # Lines look like "import time:  self [us] | cumulative | <indent>name"; keep app's direct imports
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or line.count('|') != 2:
+            continue
+        _, cumulative, name = line.split('|')
+        if name.startswith('   ') and not name.startswith('    '):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--max-seconds', type=float, default=None, help='Fail if the median import time is above this')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='astra-import-')
+    db_path = os.path.join(tmpdir, 'import.db')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', SMS_TRANSPORT='fake', LOG_LEVEL='WARNING')
+
+    timings = []
+    for _ in range(args.runs):
+        result, _ = probe(env)
+        timings.append(result['seconds'])
+    result, log = probe(env, importtime=True)
+
+    print(f"import app: median {statistics.median(timings) * 1000:.0f} ms, "
+          f"min {min(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms over {args.runs} runs")
+    print("Slowest direct imports (cumulative):")
+    for micros, name in slowest_imports(log, args.top):
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    failures = []
+    if result['loaded']:
+        failures.append(f"modules loaded at import that should be lazy: {', '.join(result['loaded'])}")
+    if os.path.exists(db_path):
+        failures.append('importing the app created or modified the database')
+    if args.max_seconds is not None and statistics.median(timings) > args.max_seconds:
+        failures.append(f'median import time is above {args.max_seconds:.2f} s')
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
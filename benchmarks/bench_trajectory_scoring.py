@@ -0,0 +1,89 @@
+"""Times run_trajectory_scoring() against a database holding an hour of pings per tourist.
+
+Seeds --tourists active tourists with --pings 15-second pings each (random walks
+around India; about 1% move implausibly fast), then times loading those pings into
+NumPy on its own, a first run that fits the model, and a warm run that reuses it.
+Runs against a throwaway SQLite database unless DATABASE_URL is set.
+
+Usage: python benchmarks/bench_trajectory_scoring.py [--tourists 2000] [--pings 240]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='astra-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'bench.db')}")
+os.environ['TRAJECTORY_MODEL_PATH'] = os.path.join(_tmpdir, 'model.joblib')
+
+from sqlalchemy import insert
+
+from app import app, init_db, load_trajectory_pings, run_trajectory_scoring
+from database import db, Anomaly, LocationPing, Tourist
+from fleet import tourist_rows
+
+PING_INTERVAL = 15 # Seconds between a tourist's pings, as the mobile client sends them
+
+
+def seed(tourists, pings, random_seed):
+    """Replaces all tourists and pings with `tourists` active tourists and their last `pings` pings."""
+    now = datetime.utcnow()
+    db.session.query(Anomaly).delete()
+    db.session.query(LocationPing).delete()
+    db.session.query(Tourist).delete()
+    rows = tourist_rows(tourists, random.Random(random_seed), 'bench', now=now)
+    for i, row in enumerate(rows):
+        row['id'] = i + 1
+    db.session.execute(insert(Tourist), rows)
+
+    # Each tourist walks away from its fleet position
+    rng = np.random.default_rng(random_seed)
+    step = rng.normal(0, 0.0005, size=(tourists, pings, 2))
+    step[rng.random(tourists) < 0.01] *= 200
+    start = np.array([(row['last_latitude'], row['last_longitude']) for row in rows])
+    path = start[:, None, :] + np.cumsum(step, axis=1)
+    times = [now - timedelta(seconds=PING_INTERVAL * (pings - k)) for k in range(pings)]
+    for first in range(0, tourists, 500):
+        db.session.execute(insert(LocationPing), [
+            {'tourist_id': i + 1, 'timestamp': times[k], 'latitude': float(path[i, k, 0]), 'longitude': float(path[i, k, 1])}
+            for i in range(first, min(first + 500, tourists)) for k in range(pings)
+        ])
+    db.session.commit()
+
+
+def timed(run):
+    start = time.perf_counter()
+    result = run()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tourists', type=int, default=2000)
+    parser.add_argument('--pings', type=int, default=240)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    init_db()
+    with app.app_context():
+        seed(args.tourists, args.pings, args.seed)
+        load, pings = timed(lambda: load_trajectory_pings(datetime.utcnow()))
+        db.session.rollback()
+    first, fitted = timed(lambda: run_trajectory_scoring(refit=True))
+    warm, summary = timed(run_trajectory_scoring)
+
+    print(f"{args.tourists} tourists x {args.pings} pings ({pings[0].size} pings loaded)")
+    print(f"  load pings         {load * 1000:9.1f} ms  ({pings[0].size / load:,.0f} pings/s)")
+    print(f"  first run (fit)    {first * 1000:9.1f} ms  {fitted['outliers']} outliers, {fitted['logged']} logged")
+    print(f"  warm run           {warm * 1000:9.1f} ms  {summary['outliers']} outliers, {summary['logged']} logged")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Compares /api/update_location throughput with and without POSITION_WRITE_BEHIND.
+
+Drives the endpoint in-process through Flask test clients (one per tourist, pings
+round-robin across them from --threads threads) and counts the SQL statements and
+commits each mode issues per ping, including the background flushes. Runs against a
+throwaway SQLite database unless DATABASE_URL is set; point it at Postgres to see
+the effect of row locks and commit latency.
+
+Usage: python benchmarks/bench_write_behind.py [--tourists 500] [--pings 5000] [--threads 8]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='astra-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'write_behind.db')}")
+os.environ.setdefault('SMS_TRANSPORT', 'fake')
+
+from sqlalchemy import event, insert
+
+import app as astra
+from database import db, Tourist
+from position_buffer import PositionBuffer
+from fleet import random_position, tourist_rows
+
+
+def seed(count, rng):
+    db.session.query(Tourist).delete()
+    db.session.execute(insert(Tourist), tourist_rows(count, rng, 'wb'))
+    db.session.commit()
+    return [row.id for row in db.session.query(Tourist.id)]
+
+
+def run(label, tourist_ids, pings, threads, rng):
+    clients = []
+    for tourist_id in tourist_ids:
+        client = astra.app.test_client()
+        with client.session_transaction() as s:
+            s['tourist_id'] = tourist_id
+        clients.append(client)
+    points = [random_position(rng) for _ in range(pings)]
+
+    counts = {'statements': 0, 'commits': 0}
+    count_lock = threading.Lock()
+
+    def on_statement(*args):
+        with count_lock:
+            counts['statements'] += 1
+
+    def on_commit(conn):
+        with count_lock:
+            counts['commits'] += 1
+
+    def worker(offset):
+        for i in range(offset, pings, threads):
+            lat, lon = points[i]
+            clients[i % len(clients)].post('/api/update_location', json={'latitude': lat, 'longitude': lon})
+
+    event.listen(db.engine, 'before_cursor_execute', on_statement)
+    event.listen(db.engine, 'commit', on_commit)
+    try:
+        start = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+        if astra.position_buffer is not None:
+            astra.position_buffer.flush()
+        astra.ping_buffer.flush()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', on_statement)
+        event.remove(db.engine, 'commit', on_commit)
+    print(f"{label:<13} | {pings / elapsed:8.0f} pings/s | {elapsed * 1000:9.1f} ms | "
+          f"{counts['statements'] / pings:5.2f} statements/ping | {counts['commits'] / pings:5.3f} commits/ping")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tourists', type=int, default=500)
+    parser.add_argument('--pings', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    astra.init_db()
+    with astra.app.app_context():
+        astra.position_buffer = None
+        run('synchronous', seed(args.tourists, rng), args.pings, args.threads, rng)
+        astra.position_buffer = PositionBuffer(astra.app, astra.tourist_payload)
+        run('write-behind', seed(args.tourists, rng), args.pings, args.threads, rng)
+
+
+if __name__ == '__main__':
+    main()
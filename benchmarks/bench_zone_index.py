@@ -0,0 +1,70 @@
+"""Compares the geofence grid index against linear zone scans (scalar and NumPy).
+
+Usage: python benchmarks/bench_zone_index.py [--queries N] [--seed S]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo import haversine, within_radius
+from zone_index import ZoneEntry, ZoneGridIndex
+from fleet import random_position, zone_rows
+
+
+def make_zones(count, rng):
+    return [ZoneEntry(i, **row) for i, row in enumerate(zone_rows(count, rng))]
+
+
+def linear_scan(zones, lat, lon):
+    return [z for z in zones if haversine(lat, lon, z.latitude, z.longitude) <= z.radius]
+
+
+def timed(fn, points):
+    start = time.perf_counter()
+    results = [fn(lat, lon) for lat, lon in points]
+    return time.perf_counter() - start, results
+
+
+def run(zone_count, queries, rng):
+    zones = make_zones(zone_count, rng)
+    points = [random_position(rng) for _ in range(queries)]
+
+    start = time.perf_counter()
+    index = ZoneGridIndex(zones)
+    build = time.perf_counter() - start
+
+    def numpy_scan(lat, lon):
+        return [zones[i] for i in within_radius(lat, lon, index.latitudes, index.longitudes, index.radii).nonzero()[0]]
+
+    linear_time, expected = timed(lambda lat, lon: linear_scan(zones, lat, lon), points)
+    numpy_time, vectorized = timed(numpy_scan, points)
+    index_time, actual = timed(index.containing, points)
+
+    mismatches = sum(
+        {z.id for z in e} != {z.id for z in a} or {z.id for z in e} != {z.id for z in v}
+        for e, a, v in zip(expected, actual, vectorized)
+    )
+    print(f"{zone_count:>7} zones | build {build * 1000:8.1f} ms | "
+          f"linear {linear_time / queries * 1e6:9.1f} us/query | "
+          f"numpy {numpy_time / queries * 1e6:8.1f} us/query | "
+          f"index {index_time / queries * 1e6:7.1f} us/query | "
+          f"speedup {linear_time / index_time:7.1f}x | mismatches {mismatches}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for zone_count in (30, 10_000, 100_000):
+        run(zone_count, args.queries, rng)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Checks that migrations bring every supported starting point to the current schema.
+
+Two scenarios, each in its own throwaway SQLite database and child process:
+  baseline  the schema (and a few rows) written by the original app, before
+            migrations existed: init_db() must upgrade it in place
+  fresh     an empty database: init_db() must install the current schema
+Afterwards every table, column and index declared in database.py must exist, the
+baseline rows must have their positions and map cells backfilled, and the schema
+version must be the last migration. Exits non-zero on any failure.
+
+Usage: python benchmarks/check_migrations.py
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Schema created by db.create_all() in the app as first deployed (no schema_version table)
+BASELINE_SCHEMA = [
+    """CREATE TABLE tourist (
+        id INTEGER NOT NULL, digital_id VARCHAR(128) NOT NULL, name VARCHAR(100) NOT NULL,
+        phone VARCHAR(20) NOT NULL, kyc_id VARCHAR(50) NOT NULL, kyc_type VARCHAR(50) NOT NULL,
+        visit_end_date TIMESTAMP NOT NULL, safety_score INTEGER, last_known_location VARCHAR(100),
+        registration_date TIMESTAMP NOT NULL, last_updated_at TIMESTAMP,
+        PRIMARY KEY (id), UNIQUE (digital_id), UNIQUE (phone), UNIQUE (kyc_id))""",
+    """CREATE TABLE safety_zone (
+        id INTEGER NOT NULL, name VARCHAR(100) NOT NULL, latitude FLOAT NOT NULL, longitude FLOAT NOT NULL,
+        radius FLOAT NOT NULL, regional_score INTEGER NOT NULL, PRIMARY KEY (id))""",
+    """CREATE TABLE alert (
+        id INTEGER NOT NULL, tourist_id INTEGER NOT NULL, location VARCHAR(100), alert_type VARCHAR(100),
+        timestamp TIMESTAMP, PRIMARY KEY (id), FOREIGN KEY(tourist_id) REFERENCES tourist (id))""",
+    """CREATE TABLE anomaly (
+        id INTEGER NOT NULL, tourist_id INTEGER NOT NULL, anomaly_type VARCHAR(100), description VARCHAR(255),
+        timestamp TIMESTAMP, status VARCHAR(20), PRIMARY KEY (id), FOREIGN KEY(tourist_id) REFERENCES tourist (id))""",
+    """INSERT INTO tourist (id, digital_id, name, phone, kyc_id, kyc_type, visit_end_date, safety_score,
+        last_known_location, registration_date, last_updated_at)
+        VALUES (1, 'd1', 'Baseline Tourist', '+910000000001', 'K1', 'Passport', '2099-01-01 00:00:00', 90,
+                'Lat: 28.6139, Lon: 77.209', '2024-01-01 00:00:00', '2024-01-01 00:00:00')""",
+    """INSERT INTO alert (tourist_id, location, alert_type, timestamp)
+        VALUES (1, 'Lat: 28.6139, Lon: 77.209', 'Panic Button', '2024-01-01 00:00:00')""",
+    """INSERT INTO anomaly (tourist_id, anomaly_type, description, timestamp, status)
+        VALUES (1, 'Warning Inactivity (10+ min)', '', '2024-01-01 00:00:00', 'active')""",
+]
+
+
+def run_scenario(scenario):
+    """Runs in the child process, with DATABASE_URL pointing at an empty database."""
+    from sqlalchemy import inspect, text
+
+    import app as astra
+    import migrations
+    from database import db
+
+    with astra.app.app_context():
+        if scenario == 'baseline':
+            with db.engine.begin() as conn:
+                for statement in BASELINE_SCHEMA:
+                    conn.execute(text(statement))
+    astra.init_db()
+
+    problems = []
+    with astra.app.app_context(), db.engine.connect() as conn:
+        inspector = inspect(conn)
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                problems.append(f'missing table {table.name}')
+                continue
+            columns = {c['name'] for c in inspector.get_columns(table.name)}
+            problems += [f'missing column {table.name}.{c.name}' for c in table.columns if c.name not in columns]
+            indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+            problems += [f'missing index {i.name}' for i in table.indexes if i.name not in indexes]
+        if scenario == 'baseline':
+            # Data written before migrations must be usable by the map and the viewport queries
+            tourist = conn.execute(text('SELECT last_latitude, last_longitude, cell FROM tourist WHERE id = 1')).one()
+            if None in tourist:
+                problems.append(f'baseline tourist position not backfilled: {tuple(tourist)}')
+            if conn.execute(text('SELECT cell FROM alert')).scalar() is None:
+                problems.append('baseline alert cell not backfilled')
+        version = migrations.current_version(conn)
+        if version != migrations.MIGRATIONS[-1][0]:
+            problems.append(f'schema version is {version}, expected {migrations.MIGRATIONS[-1][0]}')
+    return problems
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--scenario':
+        problems = run_scenario(sys.argv[2])
+        for problem in problems:
+            print(f"       {problem}")
+        sys.exit(1 if problems else 0)
+
+    failed = False
+    for scenario in ('baseline', 'fresh'):
+        tmpdir = tempfile.mkdtemp(prefix='astra-migrations-')
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmpdir, 'migrate.db')}",
+                   SMS_TRANSPORT='fake', LOG_LEVEL='WARNING')
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--scenario', scenario],
+                                cwd=ROOT, env=env, capture_output=True, text=True)
+        ok = result.returncode == 0
+        failed |= not ok
+        print(f"[{'ok' if ok else 'FAIL'}] {scenario}")
+        if not ok:
+            print(result.stdout + result.stderr[-2000:])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
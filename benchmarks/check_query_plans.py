@@ -0,0 +1,126 @@
+"""Checks that the hot dedupe queries are answered from indexes, not full table scans.
+
+Captures the SQL that update_location's helpers, check_for_anomalies(), the
+dashboard list validators and the map's viewport query actually send, then asks the database for its plan (EXPLAIN QUERY PLAN on SQLite, EXPLAIN
+with sequential scans disabled on Postgres). Exits non-zero if any of them scans
+the tourist, alert, anomaly or dashboard_event table. Runs against a throwaway SQLite database
+unless DATABASE_URL is set.
+
+Usage: python benchmarks/check_query_plans.py
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp(prefix='astra-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'plans.db')}")
+
+from sqlalchemy import event, insert, text
+
+import dashboard_events
+from app import (app, init_db, inactive_tourists_query, active_inactivity_anomalies_query, last_geofence_alert_query,
+                 WARNING_THRESHOLD, CRITICAL_THRESHOLD, ANOMALY_DEDUPE_WINDOW, ANOMALY_EVENTS, get_tourists_data)
+from database import db, Tourist, Alert, Anomaly, ALERT_GEOFENCE, ALERT_PANIC
+from fleet import tourist_rows
+
+HOT_TABLES = ('tourist', 'alert', 'anomaly', 'dashboard_event')
+
+
+def seed(rng, tourists=2000):
+    now = datetime.utcnow()
+    if Tourist.query.count():
+        return
+    rows = tourist_rows(tourists, rng, 'plan', now=now)
+    for row in rows:
+        row['visit_end_date'] = now + timedelta(days=rng.randint(-5, 5))
+        row['last_updated_at'] = now - timedelta(minutes=rng.uniform(0, 60))
+    db.session.execute(insert(Tourist), rows)
+    db.session.execute(insert(Alert), [{
+        'tourist_id': rng.randint(1, tourists), 'alert_type': 'Geo-fence Breach: Entered Zone', 'category': rng.choice((ALERT_GEOFENCE, ALERT_PANIC)),
+        'location': 'Lat: 0, Lon: 0', 'timestamp': now - timedelta(hours=rng.uniform(0, 48)),
+    } for _ in range(tourists * 5)])
+    db.session.execute(insert(Anomaly), [{
+        'tourist_id': rng.randint(1, tourists), 'anomaly_type': rng.choice(('Warning Inactivity (10+ min)', 'Critical Inactivity (20+ min)')),
+        'description': '', 'status': rng.choice(('active', 'resolved', 'resolved')), 'timestamp': now - timedelta(hours=rng.uniform(0, 48)),
+    } for _ in range(tourists * 5)])
+    db.session.commit()
+    if db.engine.dialect.name == 'sqlite':
+        db.session.execute(text('ANALYZE'))
+    else:
+        db.session.execute(text('ANALYZE tourist; ANALYZE alert; ANALYZE anomaly'))
+    db.session.commit()
+
+
+def captured_sql(run):
+    """Runs `run()` and returns the (statement, parameters) pairs it sent to the database."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+    return statements
+
+
+def plan(statement, parameters):
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+            return [row[-1] for row in rows]
+        conn.exec_driver_sql('SET enable_seqscan = off')
+        return [row[0] for row in conn.exec_driver_sql('EXPLAIN ' + statement, parameters).all()]
+
+
+def full_scans(lines):
+    scans = []
+    for line in lines:
+        for table in HOT_TABLES:
+            if line.startswith(f'SCAN {table}') or f'Seq Scan on {table} ' in line + ' ':
+                scans.append(line.strip())
+    return scans
+
+
+def viewport_tourists(bbox):
+    with app.test_request_context(f'/api/dashboard/tourists?limit=500&bbox={bbox}'):
+        return get_tourists_data()
+
+
+def main():
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    checks = {
+        'update_location: geofence cooldown lookup': lambda: last_geofence_alert_query(17).scalar(),
+        'update_location: active inactivity anomalies': lambda: active_inactivity_anomalies_query(17).all(),
+        'check_for_anomalies: inactive tourists (full pass)': lambda: inactive_tourists_query(
+            now, WARNING_THRESHOLD, CRITICAL_THRESHOLD, ANOMALY_DEDUPE_WINDOW).all(),
+        'check_for_anomalies: inactive tourists (scheduler batch)': lambda: inactive_tourists_query(
+            now, WARNING_THRESHOLD, CRITICAL_THRESHOLD, ANOMALY_DEDUPE_WINDOW, tourist_ids=[3, 5, 8]).all(),
+        'dashboard lists: anomaly change counters (validator)': lambda: dashboard_events.versions(ANOMALY_EVENTS),
+        'dashboard map: tourists in the viewport': lambda: viewport_tourists('28.55,77.15,28.65,77.30'),
+    }
+
+    failed = False
+    init_db()
+    with app.app_context():
+        seed(rng)
+        for name, run in checks.items():
+            for statement, parameters in captured_sql(run):
+                lines = plan(statement, parameters)
+                scans = full_scans(lines)
+                failed |= bool(scans)
+                print(f"[{'FAIL' if scans else 'ok'}] {name}")
+                for line in lines:
+                    print(f"       {line}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
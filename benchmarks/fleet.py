@@ -0,0 +1,45 @@
+"""Synthetic fleet shared by the benchmarks and the load test, so each of them measures the same data.
+
+Positions are uniform over the bounding box below; zones follow the size mix of the
+seed data. The row builders return dicts for insert(Tourist) / insert(SafetyZone);
+callers override the fields a scenario depends on (e.g. last_updated_at).
+"""
+from datetime import datetime, timedelta
+
+import tile_grid
+
+# Roughly the bounding box of India, where the seeded zones live
+LAT_RANGE = (8.0, 35.0)
+LON_RANGE = (68.0, 97.0)
+
+
+def random_position(rng):
+    return rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+
+
+def tourist_rows(count, rng, tag, phone_prefix='+91', now=None):
+    """`count` active tourists at random positions, last seen `now`; `tag` keeps their unique keys apart."""
+    now = now or datetime.utcnow()
+    rows = []
+    for i in range(count):
+        lat, lon = random_position(rng)
+        rows.append({
+            'digital_id': f'{tag}-{i}', 'name': f'Tourist {i}', 'phone': f'{phone_prefix}{i:010d}',
+            'kyc_id': f'{tag.upper()}{i}', 'kyc_type': 'Passport', 'visit_end_date': now + timedelta(days=3),
+            'safety_score': 100, 'registration_date': now, 'last_updated_at': now,
+            'last_known_location': f'Lat: {lat}, Lon: {lon}', 'last_latitude': lat, 'last_longitude': lon,
+            'cell': tile_grid.cell(lat, lon),
+        })
+    return rows
+
+
+def zone_rows(count, rng, name_prefix='Zone'):
+    """Mostly small city-scale zones with the occasional large regional one, like the seed data."""
+    rows = []
+    for i in range(count):
+        lat, lon = random_position(rng)
+        rows.append({
+            'name': f'{name_prefix} {i}', 'latitude': lat, 'longitude': lon,
+            'radius': rng.choice((4, 20, 30, 50)) if rng.random() < 0.95 else 120, 'regional_score': rng.randint(0, 100),
+        })
+    return rows
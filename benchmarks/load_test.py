@@ -0,0 +1,394 @@
+"""Load test for the tracking API with a simulated fleet.
+
+Seeds --tourists tourists and --zones safety zones (on top of the seed data from
+add_initial_data), then runs each scenario for --requests requests from --threads
+concurrent clients and reports requests/s, p50/p99 latency and SQL queries per
+request. Scenarios: update_location, update_location_batch, panic, safety_zones,
+the dashboard endpoints and check_for_anomalies.
+
+Two targets:
+  testclient  in-process through Flask's test client; also counts the queries each
+              request thread issues (background flushers are not counted)
+  gunicorn    a local `gunicorn app:app` on --port with --workers workers and the
+              threaded worker settings of gunicorn.conf.py, driven over
+              HTTP keep-alive connections; queries per request are not available.
+              With SQLite keep --workers 1 (several writer processes hit "database is
+              locked"); point DATABASE_URL at Postgres to measure multi-worker setups
+
+Results are written as JSON to --output. With --baseline, scenarios whose p99
+latency or queries per request grew by more than --max-regression (a fraction)
+are listed and the exit status is 1, so the suite can gate changes to hot paths.
+Runs against a throwaway SQLite database unless DATABASE_URL is set.
+
+Usage: python benchmarks/load_test.py [--target testclient|gunicorn] [--tourists 1000] [--zones 500]
+                                      [--requests 2000] [--threads 8] [--output results.json]
+                                      [--baseline previous.json] [--scenarios update_location,panic]
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmpdir = tempfile.mkdtemp(prefix='astra-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(_tmpdir, 'load.db')}")
+os.environ.setdefault('SMS_TRANSPORT', 'fake')
+os.environ.setdefault('CRON_SECRET_KEY', 'load-test')
+
+from sqlalchemy import event, insert
+
+import zone_index
+import tile_grid
+from app import app, init_db
+from database import db, Tourist, SafetyZone, Alert, Anomaly, ALERT_GEOFENCE, ALERT_PANIC
+from fleet import LAT_RANGE, LON_RANGE, random_position, tourist_rows, zone_rows
+
+SEED_PHONE_PREFIX = '+99' # Keeps load-test tourists apart from real registrations
+
+# Full-fleet passes are capped so they do not dominate the run
+MAX_REQUESTS = {'check_for_anomalies': 50}
+
+SCENARIOS = ['update_location', 'update_location_batch', 'panic', 'safety_zones', 'dashboard_tourists',
+             'dashboard_alerts', 'dashboard_anomalies', 'dashboard_heatmap', 'check_for_anomalies']
+HEATMAP_ZOOMS = (5, 8, 11) # Country, state and city views
+
+
+# --- Fleet ---
+def seed(tourists, zones, rng):
+    """Replaces load-test data with `tourists` tourists, `zones` extra zones and some alert/anomaly history."""
+    now = datetime.utcnow()
+    seeded = Tourist.query.filter(Tourist.phone.startswith(SEED_PHONE_PREFIX))
+    ids = [tid for (tid,) in seeded.with_entities(Tourist.id)]
+    for start in range(0, len(ids), 5000):
+        chunk = ids[start:start + 5000]
+        Alert.query.filter(Alert.tourist_id.in_(chunk)).delete(synchronize_session=False)
+        Anomaly.query.filter(Anomaly.tourist_id.in_(chunk)).delete(synchronize_session=False)
+    seeded.delete(synchronize_session=False)
+    SafetyZone.query.filter(SafetyZone.name.startswith('Load Zone ')).delete(synchronize_session=False)
+
+    db.session.execute(insert(SafetyZone), zone_rows(zones, rng, 'Load Zone'))
+    rows = tourist_rows(tourists, rng, 'load', SEED_PHONE_PREFIX, now=now)
+    for row in rows:
+        row['last_updated_at'] = now - timedelta(minutes=rng.uniform(0, 30))
+    positions = [(row['last_latitude'], row['last_longitude']) for row in rows]
+    db.session.execute(insert(Tourist), rows)
+    db.session.commit()
+
+    fleet = [(tid, phone) for tid, phone in Tourist.query.filter(Tourist.phone.startswith(SEED_PHONE_PREFIX))
+             .with_entities(Tourist.id, Tourist.phone)]
+    history = min(len(fleet) * 2, 50_000)
+    alert_positions = [rng.choice(positions) for _ in range(history)]
+    db.session.execute(insert(Alert), [{
+        'tourist_id': rng.choice(fleet)[0], 'alert_type': 'Geo-fence Breach: Entered Load Zone',
+        'category': rng.choice((ALERT_GEOFENCE, ALERT_PANIC)), 'location': f'Lat: {lat}, Lon: {lon}',
+        'cell': tile_grid.cell(lat, lon), 'timestamp': now - timedelta(hours=rng.uniform(0, 48)),
+    } for lat, lon in alert_positions])
+    db.session.execute(insert(Anomaly), [{
+        'tourist_id': rng.choice(fleet)[0], 'anomaly_type': 'Warning Inactivity (10+ min)', 'description': '',
+        'status': rng.choice(('active', 'resolved')), 'timestamp': now - timedelta(hours=rng.uniform(0, 48)),
+    } for _ in range(history)])
+    db.session.commit()
+    zone_index.invalidate()
+    return fleet
+
+
+class Walker:
+    """Random walk for one simulated tourist, starting somewhere in India."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.lat, self.lon = random_position(rng)
+
+    def step(self):
+        self.lat = min(max(self.lat + self.rng.gauss(0, 0.001), LAT_RANGE[0]), LAT_RANGE[1])
+        self.lon = min(max(self.lon + self.rng.gauss(0, 0.001), LON_RANGE[0]), LON_RANGE[1])
+        return round(self.lat, 6), round(self.lon, 6)
+
+
+def make_request(scenario, walker, rng):
+    """Returns (method, path, JSON body or None) for one request of a scenario."""
+    if scenario == 'update_location':
+        lat, lon = walker.step()
+        return 'POST', '/api/update_location', {'latitude': lat, 'longitude': lon, 'accuracy': 12.0}
+    if scenario == 'update_location_batch':
+        now_ms = int(time.time() * 1000)
+        fixes = [[now_ms - (20 - i) * 15000, *walker.step(), 15.0] for i in range(20)]
+        return 'POST', '/api/update_location/batch', {'fixes': fixes}
+    if scenario == 'panic':
+        return 'POST', '/api/panic', None
+    if scenario == 'safety_zones':
+        return 'GET', '/api/safety_zones', None
+    if scenario == 'dashboard_tourists':
+        return 'GET', f"/api/dashboard/tourists?limit=100&min_score={rng.choice((0, 40, 80))}", None
+    if scenario == 'dashboard_alerts':
+        return 'GET', '/api/dashboard/alerts?limit=100', None
+    if scenario == 'dashboard_anomalies':
+        return 'GET', '/api/dashboard/anomalies?limit=100&status=active', None
+    if scenario == 'dashboard_heatmap':
+        # A tile somewhere over the seeded fleet, as the map requests them while panning
+        z = rng.choice(HEATMAP_ZOOMS)
+        x, y = tile_grid.tile_xy(*random_position(rng), z)
+        return 'GET', f"/api/dashboard/heatmap/{z}/{x}/{y}", None
+    if scenario == 'check_for_anomalies':
+        return 'GET', f"/cron/run-anomaly-check/{os.environ['CRON_SECRET_KEY']}", None
+    raise ValueError(f"Unknown scenario {scenario!r}")
+
+
+# --- Targets ---
+class TestClientTarget:
+    """Sends requests through Flask's test client, one client (session) per simulated tourist."""
+    counts_queries = True
+
+    def __init__(self, fleet):
+        self.fleet = fleet
+
+    def client(self, tourist_id, phone):
+        client = app.test_client()
+        with client.session_transaction() as s:
+            s['tourist_id'] = tourist_id
+        return client
+
+    def send(self, client, method, path, body):
+        response = client.open(path, method=method, json=body)
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class GunicornTarget:
+    """Starts `gunicorn app:app` against the same database and talks to it over HTTP."""
+    counts_queries = False
+
+    def __init__(self, fleet, port, workers):
+        self.fleet = fleet
+        self.port = port
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', '--workers', str(workers),
+             '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'app:app'],
+            cwd=ROOT, env=os.environ.copy(),
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+                conn.request('GET', '/api/safety_zones')
+                conn.getresponse().read()
+                return
+            except OSError:
+                if self.process.poll() is not None:
+                    raise RuntimeError('gunicorn exited during startup')
+                time.sleep(0.5)
+        self.close()
+        raise RuntimeError('gunicorn did not start within 60 seconds')
+
+    def client(self, tourist_id, phone):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        conn.cookie = None
+        status = self.send(conn, 'POST', '/api/login', {'phone': phone})
+        if status != 200:
+            raise RuntimeError(f'Login failed for {phone}: HTTP {status}')
+        return conn
+
+    def send(self, conn, method, path, body):
+        headers = {'Content-Type': 'application/json'}
+        if conn.cookie:
+            headers['Cookie'] = conn.cookie
+        payload = json.dumps(body) if body is not None else None
+        for attempt in (1, 2):
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle keep-alive connection; reconnect and resend once
+                conn.close()
+                if attempt == 2:
+                    raise
+            except (http.client.HTTPException, OSError):
+                conn.close() # Reconnects on the next request
+                raise
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            conn.cookie = cookie.split(';', 1)[0]
+        return response.status
+
+    def close(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+# --- Measurement ---
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+
+def run_scenario(target, scenario, fleet, requests, threads, seed_value):
+    latencies, errors = [], 0
+    queries = {'count': 0}
+    request_threads = set()
+    lock = threading.Lock()
+
+    def count_query(*args):
+        if threading.get_ident() in request_threads:
+            with lock:
+                queries['count'] += 1
+
+    requests = min(requests, MAX_REQUESTS.get(scenario, requests))
+    rngs = [random.Random(seed_value * 1000 + t) for t in range(threads)]
+    # Each thread plays its own slice of the fleet so sessions are not shared between threads;
+    # sessions are set up before the clock starts
+    thread_clients = [
+        [(target.client(tid, phone), Walker(rngs[t])) for tid, phone in (fleet[t::threads] or fleet[:1])[:max(1, requests // threads)]]
+        for t in range(threads)
+    ]
+
+    def worker(offset):
+        nonlocal errors
+        rng, clients = rngs[offset], thread_clients[offset]
+        request_threads.add(threading.get_ident())
+        local_latencies, local_errors = [], 0
+        for i in range(offset, requests, threads):
+            client, walker = clients[(i // threads) % len(clients)]
+            method, path, body = make_request(scenario, walker, rng)
+            start = time.perf_counter()
+            try:
+                status = target.send(client, method, path, body)
+            except Exception:
+                status = None
+            local_latencies.append(time.perf_counter() - start)
+            if status is None or status >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    if target.counts_queries:
+        event.listen(db.engine, 'before_cursor_execute', count_query)
+    try:
+        workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        if target.counts_queries:
+            event.remove(db.engine, 'before_cursor_execute', count_query)
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'queries_per_request': round(queries['count'] / len(latencies), 2) if target.counts_queries and latencies else None,
+    }
+
+
+def regressions(results, baseline, max_regression):
+    """Lists scenarios whose p99 latency or queries per request grew beyond the allowed fraction."""
+    found = []
+    for scenario, current in results.items():
+        previous = baseline.get('results', {}).get(scenario)
+        if not previous:
+            continue
+        for metric in ('p99_ms', 'queries_per_request'):
+            old, new = previous.get(metric), current.get(metric)
+            if old and new is not None and new > old * (1 + max_regression):
+                found.append(f"{scenario}: {metric} {old} -> {new} (+{(new / old - 1) * 100:.0f}%)")
+    return found
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=('testclient', 'gunicorn'), default='testclient')
+    parser.add_argument('--tourists', type=int, default=1000)
+    parser.add_argument('--zones', type=int, default=500, help='extra zones on top of the 31 seeded ones')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per scenario')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn worker processes')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25)
+    args = parser.parse_args()
+
+    scenarios = [s for s in args.scenarios.split(',') if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    rng = random.Random(args.seed)
+    results = {}
+    started_at = datetime.utcnow().isoformat(timespec='seconds') + 'Z'
+    init_db()
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        fleet = seed(args.tourists, args.zones, rng)
+        target = TestClientTarget(fleet) if args.target == 'testclient' else GunicornTarget(fleet, args.port, args.workers)
+        try:
+            for scenario in scenarios:
+                results[scenario] = run_scenario(target, scenario, fleet, args.requests, args.threads, args.seed)
+                r = results[scenario]
+                qpr = f"{r['queries_per_request']:6.2f}" if r['queries_per_request'] is not None else '     -'
+                print(f"{scenario:<22} | {r['rps']:8.1f} req/s | p50 {r['p50_ms']:8.2f} ms | p99 {r['p99_ms']:8.2f} ms | "
+                      f"{qpr} queries/req | {r['errors']} errors", flush=True)
+        finally:
+            target.close()
+
+    report = {
+        'meta': {
+            'target': args.target, 'tourists': args.tourists, 'zones': args.zones, 'requests': args.requests,
+            'threads': args.threads, 'workers': args.workers if args.target == 'gunicorn' else None,
+            'database': dialect, 'revision': git_revision(), 'python': platform.python_version(),
+            'started_at': started_at,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.max_regression)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
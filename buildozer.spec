@@ -4,6 +4,7 @@ package.name = smarttourist
 package.domain = org.astra.safety
 source.dir = .
 source.include_exts = py,png,jpg,kv,atlas,db,env,html,css,js
+source.exclude_dirs = benchmarks
 version = 1.0
 requirements = python3,kivy,flask,sqlalchemy,flask-sqlalchemy,numpy,scikit-learn,twilio,python-dotenv,jnius
 orientation = portrait
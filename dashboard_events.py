@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, func, insert, update
+from sqlalchemy.orm import Session
+
+from database import db, CacheVersion, DashboardEvent, insert_ignoring_duplicates
+
+POLL_INTERVAL = 0.5     # Seconds between checks for events committed by other processes
+HEARTBEAT_INTERVAL = 15 # Seconds between keep-alive comments on an idle stream
+STREAM_LIFETIME = 300   # Streams end after this long; EventSource reconnects and resumes
+GAP_TIMEOUT = 2.0       # How long a missing sequence number may be waited on before it is skipped
+RETENTION = timedelta(minutes=10)
+PRUNE_INTERVAL = 60
+VERSION_PREFIX = 'dashboard_event:' # CacheVersion row counting the events of each type
+
+_new_events = threading.Condition()
+_last_prune = 0.0
+
+
+def publish(event_type, payload):
+    """Adds a dashboard event to the current transaction; it becomes visible on commit."""
+    db.session.add(DashboardEvent(event_type=event_type, payload=json.dumps(payload)))
+    db.session.info.setdefault('dashboard_events', set()).add(event_type)
+    _maybe_prune()
+
+
+def publish_many(event_type, payloads):
+    """Bulk variant of publish() for set-based passes that produce many events at once."""
+    if not payloads:
+        return
+    now = datetime.utcnow()
+    db.session.execute(insert(DashboardEvent), [
+        {'event_type': event_type, 'payload': json.dumps(p), 'created_at': now} for p in payloads
+    ])
+    db.session.info.setdefault('dashboard_events', set()).add(event_type)
+    _maybe_prune()
+
+
+def latest_seq():
+    return db.session.query(func.max(DashboardEvent.id)).scalar() or 0
+
+
+def versions(event_types):
+    """Returns the change counter of each of event_types, in order (0 for a type never published).
+
+    Each counter is bumped in the same transaction as the events it counts and, unlike
+    the event log, is never pruned, so it only ever moves forward.
+    """
+    names = [VERSION_PREFIX + t for t in event_types]
+    counters = dict(db.session.query(CacheVersion.name, CacheVersion.version).filter(CacheVersion.name.in_(names)))
+    return tuple(counters.get(name, 0) for name in names)
+
+
+def _bump_version(conn, name):
+    bump = update(CacheVersion).where(CacheVersion.name == name).values(version=CacheVersion.version + 1)
+    if not conn.execute(bump).rowcount:
+        conn.execute(insert_ignoring_duplicates(CacheVersion).values(name=name, version=0))
+        conn.execute(bump)
+
+
+def format_sse(seq, event_type, data):
+    return f"id: {seq}\nevent: {event_type}\ndata: {data}\n\n"
+
+
+def stream(last_seq):
+    """Yields Server-Sent Events for everything committed after last_seq.
+
+    If last_seq is None or older than the retained history, a single `resync` event
+    tells the client to reload full state before applying further deltas. Must run
+    inside an application context (use stream_with_context).
+    """
+    yield "retry: 1000\n\n"
+    oldest = db.session.query(func.min(DashboardEvent.id)).scalar()
+    if last_seq is None or (oldest is not None and last_seq < oldest - 1) or last_seq > latest_seq():
+        last_seq = latest_seq()
+        yield format_sse(last_seq, 'resync', '{}')
+    db.session.rollback()
+
+    started = last_activity = time.monotonic()
+    gap_since = None
+    while time.monotonic() - started < STREAM_LIFETIME:
+        if _maybe_prune():
+            db.session.commit()
+        rows = db.session.query(DashboardEvent.id, DashboardEvent.event_type, DashboardEvent.payload).filter(
+            DashboardEvent.id > last_seq).order_by(DashboardEvent.id).limit(500).all()
+        db.session.rollback() # End the read transaction so the next poll sees new commits
+
+        for seq, event_type, payload in rows:
+            if seq != last_seq + 1:
+                # A lower id may belong to a transaction that has not committed yet; hold
+                # back briefly so events are never delivered out of order, then skip it.
+                gap_since = gap_since or time.monotonic()
+                if time.monotonic() - gap_since < GAP_TIMEOUT:
+                    break
+            gap_since = None
+            last_seq = seq
+            last_activity = time.monotonic()
+            yield format_sse(seq, event_type, payload)
+
+        if time.monotonic() - last_activity > HEARTBEAT_INTERVAL:
+            last_activity = time.monotonic()
+            yield ": keep-alive\n\n"
+        with _new_events:
+            _new_events.wait(POLL_INTERVAL)
+
+
+def _maybe_prune():
+    # Joins the caller's transaction (at most once a minute per process); the caller commits
+    global _last_prune
+    if time.monotonic() - _last_prune < PRUNE_INTERVAL:
+        return False
+    _last_prune = time.monotonic()
+    db.session.execute(delete(DashboardEvent).where(DashboardEvent.created_at < datetime.utcnow() - RETENTION))
+    return True
+
+
+# Count each type's events once per transaction, as late as possible so the counter
+# rows stay locked only while the transaction commits; sorted so writers lock them in one order
+@event.listens_for(Session, 'before_commit')
+def _count_events(session):
+    event_types = session.info.get('dashboard_events')
+    if event_types:
+        conn = session.connection()
+        for event_type in sorted(event_types):
+            _bump_version(conn, VERSION_PREFIX + event_type)
+
+
+# Wake local streams as soon as a transaction carrying events commits
+@event.listens_for(Session, 'after_commit')
+def _events_committed(session):
+    if session.info.pop('dashboard_events', False):
+        with _new_events:
+            _new_events.notify_all()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _events_rolled_back(session):
+    session.info.pop('dashboard_events', None)
@@ -1,11 +1,37 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import ForeignKey
+from sqlalchemy import Float, ForeignKey, cast, func, insert
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
 db = SQLAlchemy()
 
+def dialect_insert(model, dialect_name):
+    """The PostgreSQL or SQLite insert() for `model`, which supports ON CONFLICT; None on other dialects."""
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(model)
+    if dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(model)
+    return None
+
+def insert_ignoring_duplicates(model):
+    """INSERT for `model` that skips rows whose unique key already exists (a plain INSERT on
+    dialects without ON CONFLICT). Must be called inside an application context."""
+    stmt = dialect_insert(model, db.engine.dialect.name)
+    return stmt.on_conflict_do_nothing() if stmt is not None else insert(model)
+
+def epoch_seconds(column, dialect_name):
+    """SQL expression for a (naive UTC) DateTime column as float Unix epoch seconds."""
+    if dialect_name == 'sqlite':
+        return (func.julianday(column) - 2440587.5) * 86400.0 # SQLite keeps DateTime as ISO text
+    return cast(func.extract('epoch', column), Float)
+
 class Tourist(db.Model):
+    __table_args__ = (
+        db.Index('ix_tourist_visit_end_date', 'visit_end_date'),
+        db.Index('ix_tourist_cell', 'cell'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     digital_id = db.Column(db.String(128), unique=True, nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -15,11 +41,15 @@ class Tourist(db.Model):
     visit_end_date = db.Column(db.DateTime, nullable=False)
     safety_score = db.Column(db.Integer, default=100)
     last_known_location = db.Column(db.String(100), default='Not Available')
+    last_latitude = db.Column(db.Float)
+    last_longitude = db.Column(db.Float)
+    cell = db.Column(db.BigInteger) # Map tile cell of the last position (see tile_grid.py)
     registration_date = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     last_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     alerts = relationship("Alert", back_populates="tourist")
     anomalies = relationship("Anomaly", back_populates="tourist")
+    emergency_contacts = relationship("EmergencyContact", back_populates="tourist")
 
 class SafetyZone(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -29,16 +59,41 @@ class SafetyZone(db.Model):
     radius = db.Column(db.Float, nullable=False) # Radius in kilometers
     regional_score = db.Column(db.Integer, nullable=False)
 
+class CacheVersion(db.Model):
+    # Change counters for data cached in memory by every process (e.g. the safety-zone snapshot);
+    # bumped in the same transaction as the write so other processes notice on their next check
+    __tablename__ = 'cache_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Alert.category values, so hot queries can filter on equality instead of LIKE on alert_type
+ALERT_PANIC = 'panic'
+ALERT_GEOFENCE = 'geofence'
+ALERT_OTHER = 'other'
+
 class Alert(db.Model):
+    __table_args__ = (
+        db.Index('ix_alert_tourist_category_timestamp', 'tourist_id', 'category', 'timestamp'),
+        db.Index('ix_alert_timestamp', 'timestamp'),
+        db.Index('ix_alert_cell_timestamp', 'cell', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     tourist_id = db.Column(db.Integer, ForeignKey('tourist.id'), nullable=False)
     location = db.Column(db.String(100))
     alert_type = db.Column(db.String(100))
+    category = db.Column(db.String(20), nullable=False, default=ALERT_OTHER) # panic, geofence, other
+    cell = db.Column(db.BigInteger) # Map tile cell where it was raised, if known (see tile_grid.py)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
     tourist = relationship("Tourist", back_populates="alerts")
 
 class Anomaly(db.Model):
+    __table_args__ = (
+        db.Index('ix_anomaly_tourist_status', 'tourist_id', 'status'),
+        db.Index('ix_anomaly_tourist_timestamp', 'tourist_id', 'timestamp'),
+        db.Index('ix_anomaly_timestamp', 'timestamp'),
+        db.Index('ix_anomaly_status_timestamp', 'status', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     tourist_id = db.Column(db.Integer, ForeignKey('tourist.id'), nullable=False)
     anomaly_type = db.Column(db.String(100))
@@ -46,4 +101,65 @@ class Anomaly(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='active') # active, resolved
     
-    tourist = relationship("Tourist", back_populates="anomalies")
\ No newline at end of file
+    tourist = relationship("Tourist", back_populates="anomalies")
+
+class LocationPing(db.Model):
+    # One row per GPS fix; the composite primary key doubles as the (tourist, time) index
+    __table_args__ = (
+        db.Index('ix_location_ping_timestamp', 'timestamp'),
+    )
+    tourist_id = db.Column(db.Integer, ForeignKey('tourist.id'), primary_key=True)
+    timestamp = db.Column(db.DateTime, primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    accuracy = db.Column(db.Float) # Reported accuracy radius in meters, if known
+
+class DashboardEvent(db.Model):
+    # Change feed for the admin dashboard stream; the id is the event sequence number
+    __table_args__ = {'sqlite_autoincrement': True} # Never reuse ids, even after pruning
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(30), nullable=False)
+    payload = db.Column(db.Text, nullable=False) # JSON
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class ExpiringEntry(db.Model):
+    # Short-lived shared state (OTP codes, rate-limit counters) visible to every worker process
+    __tablename__ = 'expiring_entry'
+    namespace = db.Column(db.String(30), primary_key=True)
+    key = db.Column(db.String(128), primary_key=True)
+    value = db.Column(db.Text, nullable=False) # JSON
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class EmergencyContact(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    tourist_id = db.Column(db.Integer, ForeignKey('tourist.id'), nullable=False, index=True)
+    name = db.Column(db.String(100))
+    phone = db.Column(db.String(20), nullable=False) # E.164
+    tourist = relationship("Tourist", back_populates="emergency_contacts")
+
+# OutboundMessage.status values
+MESSAGE_PENDING = 'pending'
+MESSAGE_SENDING = 'sending'
+MESSAGE_SENT = 'sent'
+MESSAGE_FAILED = 'failed'
+
+class OutboundMessage(db.Model):
+    # Notification outbox: rows are written in the same transaction as the event that
+    # causes them and delivered by the background workers in notifications.py
+    __tablename__ = 'outbound_message'
+    __table_args__ = (
+        db.Index('ix_outbound_message_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    destination = db.Column(db.String(20), nullable=False) # E.164 phone number
+    body = db.Column(db.Text, nullable=False)
+    kind = db.Column(db.String(20), nullable=False) # otp, panic, geofence...
+    coalesce = db.Column(db.Boolean, nullable=False, default=False) # May be merged with other messages to the same destination
+    dedupe_key = db.Column(db.String(128), unique=True) # Enqueueing the same key twice is a no-op
+    status = db.Column(db.String(10), nullable=False, default=MESSAGE_PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow) # Also the lease expiry while sending
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    provider_id = db.Column(db.String(64))
+    last_error = db.Column(db.Text)
@@ -0,0 +1,166 @@
+"""Expiring key-value stores for short-lived state such as OTP codes and rate-limit counters.
+
+Each store is one namespace with a fixed time-to-live. SqlStore keeps entries in the
+expiring_entry table so every gunicorn worker sees the same state; MemoryStore keeps
+them in-process for single-process deployments. Both expose the same methods:
+
+    set(key, value)   store value, replacing any previous one, for `ttl` seconds
+    get(key)          the value, or None if missing or expired
+    pop(key)          remove and return the value (None if missing or expired)
+    incr(key)         count of calls within the window started by the first call
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, Text, case, cast, delete, literal, select
+
+from database import db, dialect_insert, ExpiringEntry
+
+PURGE_INTERVAL = 60 # Seconds between sweeps of expired rows, per process
+DEFAULT_MAX_ENTRIES = 100_000
+
+
+class MemoryStore:
+    """In-process store bounded to max_entries; the oldest entries are evicted first when full.
+
+    All entries share one TTL, so insertion order is also expiry order and expired
+    entries are dropped from the front of an OrderedDict in O(1) amortized time.
+    """
+
+    def __init__(self, namespace, ttl, max_entries=DEFAULT_MAX_ENTRIES):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # key -> (expires_at, value), oldest first
+        self._lock = threading.Lock()
+
+    def set(self, key, value):
+        with self._lock:
+            self._store(key, value, time.monotonic())
+
+    def get(self, key):
+        with self._lock:
+            self._purge(time.monotonic())
+            entry = self._entries.get(key)
+            return entry[1] if entry else None
+
+    def pop(self, key):
+        with self._lock:
+            self._purge(time.monotonic())
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry else None
+
+    def incr(self, key):
+        with self._lock:
+            now = time.monotonic()
+            self._purge(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._store(key, 1, now)
+                return 1
+            # Keeps its place (and expiry): the window runs from the first call
+            self._entries[key] = (entry[0], entry[1] + 1)
+            return entry[1] + 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, key, value, now):
+        self._purge(now)
+        self._entries.pop(key, None)
+        self._entries[key] = (now + self.ttl, value)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _purge(self, now):
+        while self._entries:
+            key, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[key]
+
+
+class SqlStore:
+    """Store backed by the expiring_entry table, shared by every process using the database.
+
+    Each call runs in its own short transaction, independent of db.session. Expired
+    rows are ignored on read and swept by an indexed DELETE at most once a minute.
+    Must be used inside an application context.
+    """
+
+    def __init__(self, namespace, ttl):
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def set(self, key, value):
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            stmt = _upsert(conn).values(namespace=self.namespace, key=key, value=json.dumps(value),
+                                        expires_at=now + timedelta(seconds=self.ttl))
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=['namespace', 'key'],
+                set_={'value': stmt.excluded.value, 'expires_at': stmt.excluded.expires_at}))
+            _maybe_purge(conn, now)
+
+    def get(self, key):
+        with db.engine.connect() as conn:
+            value = conn.execute(select(ExpiringEntry.value).where(
+                ExpiringEntry.namespace == self.namespace, ExpiringEntry.key == key,
+                ExpiringEntry.expires_at > datetime.utcnow())).scalar()
+        return json.loads(value) if value is not None else None
+
+    def pop(self, key):
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            row = conn.execute(delete(ExpiringEntry).where(
+                ExpiringEntry.namespace == self.namespace, ExpiringEntry.key == key,
+            ).returning(ExpiringEntry.value, ExpiringEntry.expires_at)).first()
+        return json.loads(row.value) if row and row.expires_at > now else None
+
+    def incr(self, key):
+        now = datetime.utcnow()
+        table = ExpiringEntry.__table__
+        expired = table.c.expires_at <= now
+        with db.engine.begin() as conn:
+            stmt = _upsert(conn).values(namespace=self.namespace, key=key, value='1',
+                                        expires_at=now + timedelta(seconds=self.ttl))
+            # An expired row still in the table starts a fresh window instead of counting on
+            count = conn.execute(stmt.on_conflict_do_update(
+                index_elements=['namespace', 'key'],
+                set_={
+                    'value': case((expired, literal('1')), else_=cast(cast(table.c.value, Integer) + 1, Text)),
+                    'expires_at': case((expired, stmt.excluded.expires_at), else_=table.c.expires_at),
+                }).returning(table.c.value)).scalar()
+            _maybe_purge(conn, now)
+        return int(count)
+
+
+def create(namespace, ttl, backend=None):
+    """Returns a store for `namespace`; the backend comes from EXPIRING_STORE_BACKEND (sql or memory)."""
+    backend = backend or os.environ.get('EXPIRING_STORE_BACKEND', 'sql')
+    if backend == 'memory':
+        return MemoryStore(namespace, ttl, int(os.environ.get('EXPIRING_STORE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)))
+    if backend == 'sql':
+        return SqlStore(namespace, ttl)
+    raise ValueError(f"Unknown EXPIRING_STORE_BACKEND {backend!r}; expected 'sql' or 'memory'.")
+
+
+_last_purge = 0.0
+
+def _maybe_purge(conn, now):
+    global _last_purge
+    if time.monotonic() - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = time.monotonic()
+    conn.execute(delete(ExpiringEntry).where(ExpiringEntry.expires_at <= now))
+
+
+def _upsert(conn):
+    stmt = dialect_insert(ExpiringEntry, conn.dialect.name)
+    if stmt is None:
+        raise NotImplementedError(f"SqlStore supports PostgreSQL and SQLite, not {conn.dialect.name}.")
+    return stmt
@@ -0,0 +1,47 @@
+from math import radians, sin, cos, sqrt, atan2
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEGREE_LAT = 111.195 # Length of one degree of latitude in kilometers
+
+
+# --- Helper Function for Distance ---
+def haversine(lat1, lon1, lat2, lon2):
+    R = EARTH_RADIUS_KM
+    lat1_rad, lon1_rad, lat2_rad, lon2_rad = map(radians, [lat1, lon1, lat2, lon2])
+    dlon, dlat = lon2_rad - lon1_rad, lat2_rad - lat1_rad
+    a = sin(dlat / 2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return R * c
+
+
+def haversine_np(lat, lon, lats, lons):
+    """Vectorized haversine: distances in km between (lat, lon) and every point in lats/lons.
+
+    Arguments broadcast like any NumPy expression, so one point against an array of
+    points (or two equal-length arrays, pairwise) is a single array operation.
+    """
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def within_radius(lat, lon, lats, lons, radius_km):
+    """Boolean mask of the points lying within radius_km (scalar or per-point array) of (lat, lon)."""
+    return haversine_np(lat, lon, lats, lons) <= radius_km
+
+
+def bounding_box(lat, lon, radius_km):
+    """Returns (min_lat, min_lon, max_lat, max_lon) of a box that fully contains the circle."""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    # Longitude degrees shrink towards the poles, so size the box at the widest latitude it touches
+    widest = max(abs(min_lat), abs(max_lat))
+    if widest >= 89.9:
+        return min_lat, -180.0, max_lat, 180.0
+    dlon = radius_km / (KM_PER_DEGREE_LAT * cos(radians(widest)))
+    if dlon >= 180:
+        return min_lat, -180.0, max_lat, 180.0
+    return min_lat, lon - dlon, max_lat, lon + dlon
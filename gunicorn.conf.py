@@ -0,0 +1,16 @@
+"""gunicorn settings; `gunicorn app:app` picks this file up from the project root.
+
+Each open dashboard holds a request handler on /api/dashboard/stream for up to
+dashboard_events.STREAM_LIFETIME (5 minutes) before its EventSource reconnects. With
+gunicorn's default sync worker that is a whole worker process per dashboard tab, so
+a few open dashboards would stall every other request. Workers are therefore
+threaded: each process serves up to `threads` requests at once, open streams
+included, and a stream only holds a database connection while it polls.
+Size GUNICORN_THREADS above the number of dashboards expected per worker.
+"""
+import os
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75)) # Above typical load balancer idle timeouts (60 s)
@@ -0,0 +1,129 @@
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+import logs
+
+WARNING, CRITICAL = 'warning', 'critical'
+
+log = logs.get_logger('inactivity_scheduler')
+
+
+class InactivityScheduler:
+    """Fires inactivity checks exactly when a tourist's warning or critical deadline passes.
+
+    Keeps a min-heap of (deadline, tourist_id, level, last_updated_at). Each location
+    update pushes a fresh warning deadline in O(log n); entries made obsolete by a
+    newer update are skipped when they surface (lazy deletion), and the heap is
+    compacted when stale entries outnumber live ones.
+
+    `on_due(tourist_ids)` is called from the scheduler thread with the tourists whose
+    deadline expired. It must re-check them against the database, since another
+    process may have received a newer update for the same tourist.
+    `load_active()` returns (tourist_id, last_updated_at, visit_end_date) tuples and is
+    used for the full resync when the scheduler starts.
+    """
+
+    def __init__(self, on_due, load_active, warning_threshold, critical_threshold):
+        self.on_due = on_due
+        self.load_active = load_active
+        self.warning_after = timedelta(seconds=warning_threshold)
+        self.critical_after = timedelta(seconds=critical_threshold)
+        self._heap = []
+        self._tracked = {} # tourist_id -> (last_updated_at, visit_end_date)
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def __len__(self):
+        return len(self._tracked)
+
+    def touch(self, tourist_id, last_updated_at, visit_end_date=None):
+        """Records a location update and (re)schedules the tourist's warning deadline."""
+        self.start()
+        with self._cond:
+            self._tracked[tourist_id] = (last_updated_at, visit_end_date)
+            entry = (last_updated_at + self.warning_after, tourist_id, WARNING, last_updated_at)
+            wake = not self._heap or entry < self._heap[0]
+            heapq.heappush(self._heap, entry)
+            if len(self._heap) > 2 * len(self._tracked) + 1024:
+                self._compact()
+            if wake:
+                self._cond.notify()
+
+    def forget(self, tourist_id):
+        with self._cond:
+            self._tracked.pop(tourist_id, None)
+
+    def resync(self):
+        """Rebuilds the heap from the database's view of every active tourist."""
+        tracked = {tourist_id: (last_updated_at, visit_end_date)
+                   for tourist_id, last_updated_at, visit_end_date in self.load_active()
+                   if last_updated_at is not None}
+        with self._cond:
+            self._tracked = tracked
+            self._heap = []
+            self._compact()
+            self._cond.notify()
+
+    def start(self):
+        """Starts the scheduler thread once per process (gunicorn workers each get their own)."""
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='inactivity-scheduler', daemon=True).start()
+
+    def pop_due(self, now):
+        """Removes and returns the ids of tourists with an expired deadline, scheduling escalations."""
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, tourist_id, level, stamp = heapq.heappop(self._heap)
+                tracked = self._tracked.get(tourist_id)
+                if tracked is None or tracked[0] != stamp:
+                    continue # Superseded by a newer update
+                last_updated_at, visit_end_date = tracked
+                if visit_end_date is not None and visit_end_date <= now:
+                    del self._tracked[tourist_id]
+                    continue
+                due.append(tourist_id)
+                if level == WARNING:
+                    heapq.heappush(self._heap, (last_updated_at + self.critical_after, tourist_id, CRITICAL, stamp))
+                else:
+                    del self._tracked[tourist_id]
+        return due
+
+    def _compact(self):
+        # Rebuild with exactly one pending deadline per tracked tourist (caller holds the lock)
+        now = datetime.utcnow()
+        heap = []
+        for tourist_id, (last_updated_at, _) in self._tracked.items():
+            critical_at = last_updated_at + self.critical_after
+            if critical_at > now:
+                heap.append((last_updated_at + self.warning_after, tourist_id, WARNING, last_updated_at))
+            else:
+                heap.append((critical_at, tourist_id, CRITICAL, last_updated_at))
+        heapq.heapify(heap)
+        self._heap = heap
+
+    def _run(self):
+        try:
+            self.resync()
+        except Exception as e:
+            logs.log_event(log, logging.ERROR, 'inactivity_resync_failed', exc_info=e)
+        while True:
+            with self._cond:
+                timeout = None
+                if self._heap:
+                    timeout = max(0.0, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+                self._cond.wait(timeout)
+            due = self.pop_due(datetime.utcnow())
+            if due:
+                try:
+                    self.on_due(due)
+                except Exception as e:
+                    logs.log_event(log, logging.ERROR, 'inactivity_check_failed', tourists=len(due), exc_info=e)
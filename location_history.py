@@ -0,0 +1,99 @@
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+import logs
+from background import PerProcessStart
+from database import db, insert_ignoring_duplicates, LocationPing
+
+DEFAULT_BATCH_SIZE = 500     # Flush as soon as this many pings are waiting
+DEFAULT_FLUSH_INTERVAL = 2.0 # ...or at least this often, in seconds
+DEFAULT_MAX_PENDING = 50000  # Upper bound on buffered pings if the database is unavailable
+
+log = logs.get_logger('location_history')
+
+
+class PingBuffer:
+    """Collects LocationPing rows in memory and writes them in bulk from a background thread.
+
+    Requests only append to a list; a single flusher thread turns each batch into one
+    multi-row INSERT, so ping history costs no extra commit on the request path.
+    """
+
+    def __init__(self, app, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_pending=DEFAULT_MAX_PENDING):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._started = PerProcessStart(self._start_flusher)
+
+    def add(self, tourist_id, latitude, longitude, accuracy=None, timestamp=None):
+        """Queues one fix for insertion. Never touches the database itself."""
+        self.extend([{
+            'tourist_id': tourist_id,
+            'timestamp': timestamp or datetime.utcnow(),
+            'latitude': latitude,
+            'longitude': longitude,
+            'accuracy': accuracy,
+        }])
+
+    def extend(self, rows):
+        """Queues several fixes (dicts with LocationPing column names) at once."""
+        self._started.ensure()
+        with self._lock:
+            self._pending.extend(rows)
+            overflow = len(self._pending) - self.max_pending
+            if overflow > 0:
+                # Keep the most recent history when the database cannot keep up
+                del self._pending[:overflow]
+                logs.log_event(log, logging.WARNING, 'ping_buffer_overflow', dropped=overflow)
+            pending = len(self._pending)
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Writes every queued ping now. Returns the number of rows handed to the database."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                with self.app.app_context():
+                    db.session.execute(insert_ignoring_duplicates(LocationPing), _dedupe(batch))
+                    db.session.commit()
+            except Exception as e:
+                logs.log_event(log, logging.ERROR, 'ping_flush_failed', pings=len(batch), exc_info=e)
+                with self._lock:
+                    self._pending[:0] = batch[-self.max_pending:]
+                return 0
+            return len(batch)
+
+    def _start_flusher(self):
+        self._thread = threading.Thread(target=self._run, name='ping-buffer-flusher', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+def _dedupe(rows):
+    # A repeated key inside one multi-row INSERT would fail even with ON CONFLICT on Postgres
+    unique = {}
+    for row in rows:
+        unique[(row['tourist_id'], row['timestamp'])] = row
+    return list(unique.values())
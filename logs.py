@@ -0,0 +1,84 @@
+"""Structured logging: one JSON object per line, written off the request thread.
+
+Loggers live under the `astra` namespace. Records go through a QueueHandler so the
+calling thread only enqueues; a listener thread does the formatting and stderr I/O.
+High-volume per-tourist events are sampled with `log_event(..., sample_rate=...)`;
+the rate is recorded on each entry so counts can be scaled back up.
+
+Configured from LOG_LEVEL (default INFO), LOG_FORMAT (json or text) and
+LOG_SAMPLE_RATE (default 0.01, the rate used for per-tourist events).
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime, timezone
+
+SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+
+_listener = None
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    # The listener runs in this process, so records can be queued as they are: formatting
+    # (and the exc_info/fields it needs) happens on the listener thread
+    def prepare(self, record):
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = ' '.join(f'{k}={v}' for k, v in getattr(record, 'fields', {}).items())
+        line = f"{record.levelname} {record.name}: {record.getMessage()}" + (f" {fields}" if fields else '')
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def configure():
+    """Attaches the queued stderr handler to the `astra` logger. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(TextFormatter() if os.environ.get('LOG_FORMAT') == 'text' else JsonFormatter())
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, handler)
+    _listener.start()
+    atexit.register(_listener.stop) # Drains whatever is still queued
+
+    root = logging.getLogger('astra')
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    root.addHandler(_QueueHandler(records))
+    root.propagate = False
+
+
+def get_logger(name):
+    return logging.getLogger(f'astra.{name}')
+
+
+def log_event(logger, level, event, sample_rate=1.0, exc_info=None, **fields):
+    """Logs `event` with structured fields, keeping only a `sample_rate` fraction of calls."""
+    if sample_rate < 1.0:
+        if random.random() >= sample_rate:
+            return
+        fields['sample_rate'] = sample_rate
+    if logger.isEnabledFor(level):
+        logger.log(level, event, exc_info=exc_info, extra={'fields': fields})
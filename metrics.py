@@ -0,0 +1,206 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain Python objects registered at import time;
+`render()` produces the /metrics body. Values are per process: under gunicorn each
+worker reports its own, so scrape every worker (or sum by instance) rather than
+treating one response as the whole service.
+
+`instrument(app)` adds per-route request latency and, via SQLAlchemy engine events,
+the number and duration of SQL statements each request issues.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100, 250)
+
+REGISTRY = []
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _label_text(self, key, extra=()):
+        pairs = list(zip(self.labelnames, key)) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+        return '{' + ','.join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + '}'
+
+    def samples(self):
+        with self._lock:
+            return [(f'{self.name}{self._label_text(key)}', value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        lines += [f'{name} {_number(value)}' for name, value in self.samples()]
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A gauge that is either set directly or computed by `callback` at scrape time.
+
+    The callback returns a number, or a dict of label-value tuples to numbers.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        value = self.callback()
+        values = value if isinstance(value, dict) else {(): value}
+        return [(f'{self.name}{self._label_text(tuple(map(str, key)))}', v) for key, v in values.items()]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                samples.append((f'{self.name}_bucket{self._label_text(key, [("le", le)])}', cumulative))
+            samples.append((f'{self.name}_sum{self._label_text(key)}', total))
+            samples.append((f'{self.name}_count{self._label_text(key)}', cumulative))
+        return samples
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Returns every registered metric in the Prometheus text format (version 0.0.4)."""
+    blocks = []
+    for metric in REGISTRY:
+        try:
+            blocks.append(metric.render())
+        except Exception as e: # A failing gauge callback must not take the whole scrape down
+            blocks.append(f'# {metric.name} unavailable: {type(e).__name__}')
+    return '\n'.join(blocks) + '\n'
+
+
+# --- Request and SQL instrumentation ---
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request latency by route.', ('method', 'route', 'status'))
+REQUEST_QUERIES = Histogram('http_request_db_queries', 'SQL statements issued per request.', ('route',), COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram('http_request_db_seconds', 'Time spent in SQL statements per request.', ('route',))
+DB_QUERIES = Counter('db_queries_total', 'SQL statements executed, by request or background context.', ('context',))
+DB_SECONDS = Counter('db_query_seconds_total', 'Time spent executing SQL statements.', ('context',))
+
+_request = threading.local() # .queries / .db_seconds while a request is being served on this thread
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('_query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if getattr(_request, 'active', False):
+        _request.queries += 1
+        _request.db_seconds += elapsed
+        context_label = 'request'
+    else:
+        context_label = 'background'
+    DB_QUERIES.inc(context=context_label)
+    DB_SECONDS.inc(elapsed, context=context_label)
+
+
+def instrument(app):
+    """Records latency and SQL usage for every request served by `app`."""
+
+    @app.before_request
+    def _start_request_metrics():
+        g._metrics_started = time.perf_counter()
+        _request.active, _request.queries, _request.db_seconds = True, 0, 0.0
+
+    @app.after_request
+    def _record_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request_metrics(exc):
+        started = g.pop('_metrics_started', None)
+        if started is None:
+            return
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        status = g.pop('_metrics_status', 500)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route, status=status)
+        REQUEST_QUERIES.observe(_request.queries, route=route)
+        REQUEST_DB_SECONDS.observe(_request.db_seconds, route=route)
+        _request.active = False
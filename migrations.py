@@ -0,0 +1,185 @@
+"""Versioned schema migrations, applied in order and recorded in the schema_version table.
+
+A fresh database gets the current schema from the models in one create_all() and is
+recorded at the latest version. A database created by an older version of the app is
+brought forward step by step. Steps must mean the same thing forever, so a step that
+changes existing tables spells out its own columns and indexes instead of reading
+them from the models; a step may create a brand-new table from its model, since later
+steps are idempotent and find their columns already there.
+Add new steps to the end of MIGRATIONS; never edit or reorder existing ones.
+"""
+import logging
+import re
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, MetaData, String, Table, Text, inspect, text
+
+import logs
+import tile_grid
+from database import db, CacheVersion, ExpiringEntry, EmergencyContact, OutboundMessage, ALERT_PANIC, ALERT_GEOFENCE, ALERT_OTHER
+
+log = logs.get_logger('migrations')
+
+
+def _add_column(conn, table, column, ddl_type):
+    if column not in {c['name'] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+
+
+BACKFILL_CHUNK = 5000
+
+
+def _execute_in_chunks(conn, statement, params):
+    # params yields one dict per row; executemany in chunks to bound memory
+    chunk = []
+    for row in params:
+        chunk.append(row)
+        if len(chunk) == BACKFILL_CHUNK:
+            conn.execute(statement, chunk)
+            chunk = []
+    if chunk:
+        conn.execute(statement, chunk)
+
+
+# Tables step 1 added to databases created before migrations existed, as they were then
+_step_1 = MetaData()
+Table('tourist', _step_1, Column('id', Integer, primary_key=True)) # Only referenced, never created here
+Table('location_ping', _step_1,
+      Column('tourist_id', Integer, ForeignKey('tourist.id'), primary_key=True),
+      Column('timestamp', DateTime, primary_key=True),
+      Column('latitude', Float, nullable=False),
+      Column('longitude', Float, nullable=False),
+      Column('accuracy', Float))
+Table('dashboard_event', _step_1,
+      Column('id', Integer, primary_key=True),
+      Column('event_type', String(30), nullable=False),
+      Column('payload', Text, nullable=False),
+      Column('created_at', DateTime, nullable=False),
+      sqlite_autoincrement=True)
+
+
+def create_missing_tables(conn):
+    for name in ('location_ping', 'dashboard_event'):
+        _step_1.tables[name].create(conn, checkfirst=True)
+
+
+_LOCATION_TEXT = re.compile(r'Lat: (-?[\d.]+), Lon: (-?[\d.]+)')
+
+
+def add_tourist_position_columns(conn):
+    _add_column(conn, 'tourist', 'last_latitude', 'FLOAT')
+    _add_column(conn, 'tourist', 'last_longitude', 'FLOAT')
+    # Tourists not seen since the columns were added only have their position as "Lat: x, Lon: y" text
+    rows = conn.execute(text("SELECT id, last_known_location FROM tourist "
+                             "WHERE last_latitude IS NULL AND last_known_location LIKE 'Lat: %'")).all()
+    matches = ((row_id, _LOCATION_TEXT.match(location)) for row_id, location in rows)
+    _execute_in_chunks(conn, text('UPDATE tourist SET last_latitude = :lat, last_longitude = :lon WHERE id = :row_id'),
+                       ({'row_id': row_id, 'lat': float(m[1]), 'lon': float(m[2])} for row_id, m in matches if m))
+
+
+def add_alert_category(conn):
+    _add_column(conn, 'alert', 'category', f"VARCHAR(20) NOT NULL DEFAULT '{ALERT_OTHER}'")
+    # One-off backfill; new rows set the category when they are created
+    conn.execute(text("UPDATE alert SET category = :c WHERE alert_type = 'Panic Button'"), {'c': ALERT_PANIC})
+    conn.execute(text("UPDATE alert SET category = :c WHERE alert_type LIKE 'Geo-fence Breach%'"), {'c': ALERT_GEOFENCE})
+
+
+def _create_index(conn, name, table, columns):
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'))
+
+
+# The indexes this step introduced; later steps create their own
+STEP_4_INDEXES = (
+    ('ix_tourist_visit_end_date', 'tourist', ('visit_end_date',)),
+    ('ix_alert_tourist_category_timestamp', 'alert', ('tourist_id', 'category', 'timestamp')),
+    ('ix_alert_timestamp', 'alert', ('timestamp',)),
+    ('ix_anomaly_tourist_status', 'anomaly', ('tourist_id', 'status')),
+    ('ix_anomaly_tourist_timestamp', 'anomaly', ('tourist_id', 'timestamp')),
+    ('ix_anomaly_timestamp', 'anomaly', ('timestamp',)),
+    ('ix_anomaly_status_timestamp', 'anomaly', ('status', 'timestamp')),
+    ('ix_location_ping_timestamp', 'location_ping', ('timestamp',)),
+    ('ix_dashboard_event_created_at', 'dashboard_event', ('created_at',)),
+)
+
+
+def create_indexes(conn):
+    for name, table, columns in STEP_4_INDEXES:
+        _create_index(conn, name, table, columns)
+
+
+def create_expiring_entries(conn):
+    ExpiringEntry.__table__.create(conn, checkfirst=True)
+
+
+def create_notification_tables(conn):
+    EmergencyContact.__table__.create(conn, checkfirst=True)
+    OutboundMessage.__table__.create(conn, checkfirst=True)
+
+
+def create_cache_version(conn):
+    CacheVersion.__table__.create(conn, checkfirst=True)
+
+
+def _backfill_cells(conn, table, rows):
+    # rows yields (id, cell)
+    _execute_in_chunks(conn, text(f'UPDATE {table} SET cell = :cell WHERE id = :row_id'),
+                       ({'row_id': row_id, 'cell': cell} for row_id, cell in rows))
+
+
+def add_map_cells(conn):
+    _add_column(conn, 'tourist', 'cell', 'BIGINT')
+    _add_column(conn, 'alert', 'cell', 'BIGINT')
+    # One-off backfill; new positions and alerts set their cell when they are written
+    tourists = conn.execute(text('SELECT id, last_latitude, last_longitude FROM tourist '
+                                 'WHERE cell IS NULL AND last_latitude IS NOT NULL')).all()
+    _backfill_cells(conn, 'tourist', ((row_id, tile_grid.cell(lat, lon)) for row_id, lat, lon in tourists))
+    # Alerts only kept their position as "Lat: x, Lon: y" text
+    alerts = conn.execute(text("SELECT id, location FROM alert WHERE cell IS NULL AND location LIKE 'Lat: %'")).all()
+    matches = ((row_id, _LOCATION_TEXT.match(location)) for row_id, location in alerts)
+    _backfill_cells(conn, 'alert', ((row_id, tile_grid.cell(float(m[1]), float(m[2]))) for row_id, m in matches if m))
+    _create_index(conn, 'ix_tourist_cell', 'tourist', ('cell',))
+    _create_index(conn, 'ix_alert_cell_timestamp', 'alert', ('cell', 'timestamp'))
+
+
+MIGRATIONS = [
+    (1, 'create missing tables', create_missing_tables),
+    (2, 'tourist numeric position columns', add_tourist_position_columns),
+    (3, 'alert category column', add_alert_category),
+    (4, 'secondary indexes for hot queries', create_indexes),
+    (5, 'shared expiring key-value store', create_expiring_entries),
+    (6, 'emergency contacts and notification outbox', create_notification_tables),
+    (7, 'cache version counters', create_cache_version),
+    (8, 'map tile cells for tourists and alerts', add_map_cells),
+]
+
+
+def current_version(conn):
+    if not inspect(conn).has_table('schema_version'):
+        return 0
+    return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+
+
+def upgrade():
+    """Applies pending migrations. Must be called inside an application context."""
+    with db.engine.begin() as conn:
+        if conn.dialect.name == 'postgresql':
+            # Serialize concurrent upgrades from several workers starting at once
+            conn.execute(text('SELECT pg_advisory_xact_lock(727274)'))
+        conn.execute(text('CREATE TABLE IF NOT EXISTS schema_version '
+                          '(version INTEGER PRIMARY KEY, description VARCHAR(100), applied_at TIMESTAMP)'))
+        version = current_version(conn)
+        if version == 0 and not inspect(conn).has_table('tourist'):
+            # Fresh install: nothing to bring forward
+            db.metadata.create_all(conn)
+            latest, description, _ = MIGRATIONS[-1]
+            conn.execute(text('INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)'),
+                         {'v': latest, 'd': f'fresh install ({description})', 't': datetime.utcnow()})
+            logs.log_event(log, logging.INFO, 'schema_installed', version=latest)
+            return
+        for number, description, step in MIGRATIONS:
+            if number <= version:
+                continue
+            step(conn)
+            conn.execute(text('INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)'),
+                         {'v': number, 'd': description, 't': datetime.utcnow()})
+            logs.log_event(log, logging.INFO, 'schema_migration_applied', version=number, description=description)
@@ -0,0 +1,257 @@
+"""Outbound SMS through a persistent outbox.
+
+Requests never talk to the SMS provider. Outbox.enqueue() adds a row to the
+outbound_message table in the caller's transaction, so a notification exists if and
+only if the event that caused it was committed. A dispatcher thread per process
+claims due rows in batches (SELECT ... FOR UPDATE SKIP LOCKED on Postgres, so several
+gunicorn workers can share the queue), merges coalescable messages to the same
+destination into one SMS, and hands them to a small thread pool that calls the
+transport. Failures are retried with exponential backoff; rows whose claim lease
+expires (e.g. the process died mid-send) are picked up again.
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, event, func, select, update
+from sqlalchemy.orm import Session
+
+import logs
+import metrics
+from background import PerProcessStart
+from database import db, insert_ignoring_duplicates, OutboundMessage, MESSAGE_PENDING, MESSAGE_SENDING, MESSAGE_SENT, MESSAGE_FAILED
+
+DEFAULT_WORKERS = 4        # Concurrent transport calls per process
+DEFAULT_BATCH_SIZE = 50    # Rows claimed per dispatcher pass
+DEFAULT_MAX_ATTEMPTS = 6
+POLL_INTERVAL = 1.0        # Seconds between checks for rows enqueued by other processes
+LEASE = timedelta(seconds=60) # A claimed row is retried if not settled within this time
+BACKOFF_BASE = 5           # Seconds before the first retry; doubles with each attempt
+BACKOFF_MAX = 600
+SMS_MAX_LENGTH = 1600      # Longest body Twilio accepts for a single message
+RETENTION = timedelta(days=1) # Sent and failed rows are deleted after this long
+SECRET_KINDS = ('otp',)       # Bodies blanked once settled, so codes do not sit in the table for RETENTION
+PRUNE_INTERVAL = 3600
+
+_new_messages = threading.Event()
+
+log = logs.get_logger('notifications')
+MESSAGES = metrics.Counter('sms_messages_total', 'Outbox messages settled, by kind and result (sent, retry, failed).',
+                           ('kind', 'result'))
+SEND_SECONDS = metrics.Histogram('sms_send_duration_seconds', 'Transport call latency per outgoing SMS.')
+
+
+class PermanentError(Exception):
+    """Delivery failed in a way retrying will not fix, e.g. an invalid destination number."""
+
+
+class TwilioTransport:
+    """Sends through Twilio. The client (and the twilio package) is loaded on the first send."""
+
+    def __init__(self, account_sid, auth_token, from_number):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from twilio.rest import Client
+                self._client = Client(self.account_sid, self.auth_token)
+            return self._client
+
+    def send(self, to, body):
+        """Sends one SMS and returns the provider's message id."""
+        from twilio.base.exceptions import TwilioRestException
+        try:
+            return self.client.messages.create(body=body, from_=self.from_number, to=to).sid
+        except TwilioRestException as e:
+            # 400/404 mean the request itself is bad (invalid number, unverified recipient...);
+            # 429 and 5xx are worth retrying
+            if e.status in (400, 404):
+                raise PermanentError(str(e)) from e
+            raise
+
+
+class FakeTransport:
+    """Records messages in memory instead of sending them; for local runs, tests and benchmarks."""
+
+    def __init__(self, latency=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = [] # (to, body) in delivery order
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, to, body):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self._rng.random() < self.failure_rate:
+                raise ConnectionError('Simulated transport failure')
+            self.sent.append((to, body))
+            return f"FAKE{len(self.sent)}"
+
+
+class Outbox:
+    def __init__(self, app, transport, workers=DEFAULT_WORKERS, batch_size=DEFAULT_BATCH_SIZE,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS, poll_interval=POLL_INTERVAL):
+        self.app = app
+        self.transport = transport
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._pool = None
+        self._started = PerProcessStart(self._start_dispatcher)
+        self._last_prune = 0.0
+
+    def enqueue(self, destination, body, kind, dedupe_key=None, coalesce=False):
+        """Adds a message to the current transaction; it is sent once the caller commits.
+
+        Enqueueing a dedupe_key that already exists does nothing. Messages with
+        coalesce=True may be merged with others to the same destination.
+        """
+        self.start()
+        db.session.execute(insert_ignoring_duplicates(OutboundMessage), [{
+            'destination': destination, 'body': body, 'kind': kind, 'coalesce': coalesce,
+            'dedupe_key': dedupe_key, 'status': MESSAGE_PENDING, 'next_attempt_at': datetime.utcnow(),
+        }])
+        db.session.info['outbox'] = True
+
+    def start(self):
+        self._started.ensure()
+
+    def _start_dispatcher(self):
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='sms')
+        threading.Thread(target=self._run, daemon=True, name='outbox-dispatcher').start()
+
+    def pending_count(self):
+        return db.session.query(func.count(OutboundMessage.id)).filter(
+            OutboundMessage.status.in_([MESSAGE_PENDING, MESSAGE_SENDING])).scalar()
+
+    def pending_by_kind(self):
+        """Returns {(kind,): count} of messages not yet settled, for the queue-depth gauge."""
+        return {(kind,): count for kind, count in db.session.query(OutboundMessage.kind, func.count(OutboundMessage.id))
+                .filter(OutboundMessage.status.in_([MESSAGE_PENDING, MESSAGE_SENDING])).group_by(OutboundMessage.kind)}
+
+    def drain(self):
+        """Claims and delivers one batch of due messages. Returns how many rows were settled.
+
+        Must be called inside an application context.
+        """
+        self.start()
+        rows = self._claim()
+        if not rows:
+            return 0
+        groups = coalesce_messages(rows)
+        results = list(self._pool.map(self._deliver, groups))
+        self._record(zip(groups, results))
+        return len(rows)
+
+    def _claim(self):
+        now = datetime.utcnow()
+        due = select(OutboundMessage.id).where(
+            OutboundMessage.status.in_([MESSAGE_PENDING, MESSAGE_SENDING]),
+            OutboundMessage.next_attempt_at <= now,
+        ).order_by(OutboundMessage.next_attempt_at).limit(self.batch_size).with_for_update(skip_locked=True)
+        with db.engine.begin() as conn:
+            return conn.execute(update(OutboundMessage).where(OutboundMessage.id.in_(due)).values(
+                status=MESSAGE_SENDING, next_attempt_at=now + LEASE, attempts=OutboundMessage.attempts + 1,
+            ).returning(OutboundMessage.id, OutboundMessage.destination, OutboundMessage.body, OutboundMessage.kind,
+                        OutboundMessage.coalesce, OutboundMessage.attempts)).all()
+
+    def _deliver(self, group):
+        """Returns (provider_id, error, permanent) for one outgoing SMS."""
+        try:
+            with SEND_SECONDS.time():
+                return self.transport.send(group[0].destination, '\n\n'.join(row.body for row in group)), None, False
+        except PermanentError as e:
+            return None, str(e), True
+        except Exception as e:
+            return None, str(e) or type(e).__name__, False
+
+    def _record(self, outcomes):
+        now = datetime.utcnow()
+        settled = [] # (kind, result) per row, counted once the transaction commits
+        # A row that will not be sent again keeps its body only if it is not a secret
+        final_body = case((OutboundMessage.kind.in_(SECRET_KINDS), ''), else_=OutboundMessage.body)
+        with db.engine.begin() as conn:
+            for group, (provider_id, error, permanent) in outcomes:
+                if error is None:
+                    conn.execute(update(OutboundMessage).where(OutboundMessage.id.in_([row.id for row in group])).values(
+                        status=MESSAGE_SENT, sent_at=now, provider_id=provider_id, last_error=None, body=final_body))
+                    settled += [(row.kind, 'sent') for row in group]
+                    continue
+                logs.log_event(log, logging.WARNING, 'sms_send_failed', messages=len(group), permanent=permanent,
+                               attempts=max(row.attempts for row in group), error=error)
+                for row in group:
+                    if permanent or row.attempts >= self.max_attempts:
+                        values = {'status': MESSAGE_FAILED, 'body': final_body}
+                        settled.append((row.kind, 'failed'))
+                    else:
+                        values = {'status': MESSAGE_PENDING, 'next_attempt_at': now + retry_delay(row.attempts)}
+                        settled.append((row.kind, 'retry'))
+                    conn.execute(update(OutboundMessage).where(OutboundMessage.id == row.id).values(last_error=error, **values))
+            self._maybe_prune(conn, now)
+        for kind, result in settled:
+            MESSAGES.inc(kind=kind, result=result)
+
+    def _maybe_prune(self, conn, now):
+        if time.monotonic() - self._last_prune < PRUNE_INTERVAL:
+            return
+        self._last_prune = time.monotonic()
+        # Settled rows keep their last lease time in next_attempt_at, so the status index covers this
+        conn.execute(delete(OutboundMessage).where(
+            OutboundMessage.status.in_([MESSAGE_SENT, MESSAGE_FAILED]), OutboundMessage.next_attempt_at < now - RETENTION))
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    while self.drain() == self.batch_size:
+                        pass # Keep going while there is a backlog
+            except Exception as e:
+                logs.log_event(log, logging.ERROR, 'outbox_dispatcher_error', exc_info=e)
+            _new_messages.wait(self.poll_interval)
+            _new_messages.clear()
+
+
+def coalesce_messages(rows):
+    """Groups claimed rows into outgoing SMS: coalescable rows to the same destination are
+    merged (in enqueue order) up to SMS_MAX_LENGTH; everything else is sent on its own."""
+    groups, open_groups = [], {}
+    for row in sorted(rows, key=lambda r: r.id):
+        if not row.coalesce:
+            groups.append([row])
+            continue
+        group = open_groups.get(row.destination)
+        if group is None or sum(len(r.body) + 2 for r in group) + len(row.body) > SMS_MAX_LENGTH:
+            group = open_groups[row.destination] = []
+            groups.append(group)
+        group.append(row)
+    return groups
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, so a provider outage does not end in a synchronized burst."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+
+# Wake the local dispatcher as soon as a transaction carrying messages commits
+@event.listens_for(Session, 'after_commit')
+def _messages_committed(session):
+    if session.info.pop('outbox', False):
+        _new_messages.set()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _messages_rolled_back(session):
+    session.info.pop('outbox', None)
@@ -0,0 +1,197 @@
+import atexit
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from sqlalchemy import bindparam, case, or_, update
+
+import dashboard_events
+import logs
+from background import PerProcessStart
+from database import db, Tourist, Anomaly
+
+DEFAULT_FLUSH_INTERVAL = 0.5 # Seconds between bulk writes of buffered positions
+STATE_TTL = 30.0             # Seconds a cached tourist row is trusted before it is re-read
+RESOLVE_CHUNK = 5000         # Tourist ids per anomaly-resolution statement (bind parameter limits)
+
+# Columns a location update reads or writes; apply_location_fixes() works on these directly
+TOURIST_COLUMNS = ('id', 'name', 'phone', 'safety_score', 'last_known_location', 'last_latitude',
+                   'last_longitude', 'cell', 'last_updated_at', 'visit_end_date')
+_Row = namedtuple('_Row', TOURIST_COLUMNS)
+# The subset a buffered update changes; take() hands these to a caller that writes them itself
+POSITION_COLUMNS = ('last_known_location', 'last_latitude', 'last_longitude', 'cell', 'last_updated_at')
+
+log = logs.get_logger('position_buffer')
+
+
+class TouristState:
+    """Mutable in-memory copy of the Tourist columns touched by location updates."""
+    __slots__ = TOURIST_COLUMNS + ('loaded_score', 'loaded_at', 'used_at', 'lock')
+
+    def __init__(self, row):
+        for name in TOURIST_COLUMNS:
+            setattr(self, name, getattr(row, name))
+        self.loaded_score = self.safety_score # Score in the database when this copy was made
+        self.loaded_at = self.used_at = time.monotonic() # Re-read after STATE_TTL; evicted STATE_TTL after last use
+        self.lock = threading.Lock() # Held while a request updates this tourist
+
+
+class PositionBuffer:
+    """Write-behind cache for tourist positions and safety scores.
+
+    Location updates modify a cached TouristState instead of the Tourist row; a
+    background thread writes every tourist changed since the last flush in one
+    executemany UPDATE, resolves their inactivity anomalies in one more statement,
+    and publishes the coalesced dashboard events, all in a single commit. Positions
+    only move forward in time, and a score is only written if the row still holds the
+    score this copy was based on, so a panic (score 0) recorded by another process is
+    never overwritten; the stale copy is simply re-read after STATE_TTL.
+    """
+
+    def __init__(self, app, payload, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.app = app
+        self.payload = payload # Builds the dashboard 'tourist' event from a TouristState
+        self.flush_interval = flush_interval
+        self._states = {}   # tourist_id -> TouristState
+        self._dirty = set() # tourist_ids changed since the last flush
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._started = PerProcessStart(self._start_flusher)
+
+    def __len__(self):
+        return len(self._dirty)
+
+    def state(self, tourist_id):
+        """Returns the cached state for a tourist (reading the row if needed), or None if unknown.
+
+        Callers mutate it under `with state.lock` and then call mark_dirty().
+        """
+        self._started.ensure()
+        with self._lock:
+            state = self._states.get(tourist_id)
+            if state is not None and (tourist_id in self._dirty or time.monotonic() - state.loaded_at < STATE_TTL):
+                state.used_at = time.monotonic()
+                return state
+        row = db.session.query(*(getattr(Tourist, name) for name in TOURIST_COLUMNS)).filter(Tourist.id == tourist_id).first()
+        if row is None:
+            return None
+        with self._lock:
+            state = self._states.get(tourist_id)
+            if state is None or (tourist_id not in self._dirty and time.monotonic() - state.loaded_at >= STATE_TTL):
+                state = self._states[tourist_id] = TouristState(_Row(*row))
+            state.used_at = time.monotonic()
+            return state
+
+    def mark_dirty(self, state):
+        with self._lock:
+            # Put it back if it was evicted meanwhile, so the change is not lost
+            self._states.setdefault(state.id, state)
+            self._dirty.add(state.id)
+
+    def take(self, tourist_id):
+        """Drops the cached copy so the next update re-reads the row, and returns it (or None).
+
+        For writers that must not wait on the flusher (a panic): they copy the
+        POSITION_COLUMNS of the returned state into the row in their own transaction,
+        if it is newer. A flush already under way may write the same position too; the
+        bulk UPDATE never moves a position back in time, so either order is safe.
+        """
+        with self._lock:
+            self._dirty.discard(tourist_id)
+            return self._states.pop(tourist_id, None)
+
+    def flush(self):
+        """Writes every changed tourist now. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty = self._dirty, set()
+                # A tourist taken by take() since it was marked is written by its taker
+                states = [state for state in map(self._states.get, dirty) if state is not None]
+                dirty = {state.id for state in states}
+            if not states:
+                return 0
+            rows, payloads = [], []
+            for state in states:
+                with state.lock:
+                    rows.append(self._row_params(state))
+                    payloads.append(self.payload(state))
+            try:
+                with self.app.app_context():
+                    db.session.connection().execute(_bulk_position_update(), rows)
+                    ids, resolved = list(dirty), []
+                    for start in range(0, len(ids), RESOLVE_CHUNK):
+                        resolved += db.session.execute(update(Anomaly).where(
+                            Anomaly.tourist_id.in_(ids[start:start + RESOLVE_CHUNK]), Anomaly.status == 'active',
+                            Anomaly.anomaly_type.like('%Inactivity%'),
+                        ).values(status='resolved').returning(Anomaly.tourist_id, Anomaly.anomaly_type)).all()
+                    dashboard_events.publish_many('tourist', payloads)
+                    dashboard_events.publish_many('anomalies_resolved', _resolved_payloads(resolved))
+                    db.session.commit()
+            except Exception as e:
+                logs.log_event(log, logging.ERROR, 'position_flush_failed', tourists=len(rows), exc_info=e)
+                with self._lock:
+                    self._dirty |= dirty
+                return 0
+            with self._lock:
+                for row in rows:
+                    state = self._states.get(row['_id'])
+                    if state is not None:
+                        state.loaded_score = row['_score']
+            if resolved:
+                logs.log_event(log, logging.INFO, 'anomalies_resolved', count=len(resolved),
+                               tourists=len({r.tourist_id for r in resolved}))
+            return len(rows)
+
+    @staticmethod
+    def _row_params(state):
+        return {
+            '_id': state.id, '_lat': state.last_latitude, '_lon': state.last_longitude,
+            '_location': state.last_known_location, '_cell': state.cell, '_updated_at': state.last_updated_at,
+            '_score': state.safety_score, '_loaded_score': state.loaded_score,
+        }
+
+    def _start_flusher(self):
+        threading.Thread(target=self._run, name='position-buffer-flusher', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                self._expire()
+            except Exception as e:
+                logs.log_event(log, logging.ERROR, 'position_flusher_error', exc_info=e)
+
+    def _expire(self):
+        # Keeps the cache to tourists seen recently; dirty entries always survive until flushed
+        now = time.monotonic()
+        with self._lock:
+            stale = [tid for tid, s in self._states.items() if tid not in self._dirty and now - s.used_at >= STATE_TTL]
+            for tourist_id in stale:
+                del self._states[tourist_id]
+
+
+def _bulk_position_update():
+    tourist = Tourist.__table__
+    return update(tourist).where(
+        tourist.c.id == bindparam('_id'),
+        or_(tourist.c.last_updated_at.is_(None), tourist.c.last_updated_at <= bindparam('_updated_at')),
+    ).values(
+        last_latitude=bindparam('_lat'),
+        last_longitude=bindparam('_lon'),
+        last_known_location=bindparam('_location'),
+        cell=bindparam('_cell'),
+        last_updated_at=bindparam('_updated_at'),
+        # Compare-and-set: keep a score another process changed since this copy was read
+        safety_score=case((tourist.c.safety_score == bindparam('_loaded_score'), bindparam('_score')),
+                          else_=tourist.c.safety_score),
+    )
+
+
+def _resolved_payloads(resolved):
+    by_tourist = {}
+    for tourist_id, anomaly_type in resolved:
+        by_tourist.setdefault(tourist_id, set()).add(anomaly_type)
+    return [{'tourist_id': tid, 'anomaly_types': sorted(types)} for tid, types in by_tourist.items()]
@@ -0,0 +1,104 @@
+"""Slippy-map tile cells for aggregating tourists and alerts on the dashboard map.
+
+Every stored position also records its cell: the Morton (Z-order) code of the Web
+Mercator tile containing it at BASE_ZOOM, i.e. the bits of the tile x and y
+interleaved. In Z-order the cells under a tile at any coarser zoom form one
+contiguous range, and a cell's ancestor at zoom z is the cell shifted right by
+2 * (BASE_ZOOM - z). So a map tile is one index range scan, and splitting it into
+bins is a GROUP BY on the shifted cell; the work per tile depends on how many rows
+fall inside it, and the response on the number of bins, never on the fleet size.
+"""
+from math import cos, floor, log, pi, radians, tan
+
+BASE_ZOOM = 20     # Cell resolution: about 38 m at the equator
+BIN_LEVELS = 4     # Each tile is aggregated into (2 ** BIN_LEVELS) ** 2 = 256 bins
+MAX_LATITUDE = 85.0511287798 # Web Mercator stops here
+
+
+def tile_xy(lat, lon, zoom):
+    """Returns the (x, y) of the slippy-map tile containing the point at `zoom`."""
+    n = 1 << zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = floor((lon + 180.0) / 360.0 * n)
+    y = floor((1.0 - log(tan(radians(lat)) + 1.0 / cos(radians(lat))) / pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def _spread(v):
+    # Moves bit i of a 32-bit value to bit 2i
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    return (v | (v << 1)) & 0x5555555555555555
+
+
+def _compact(v):
+    # Inverse of _spread: gathers the even bits back together
+    v &= 0x5555555555555555
+    v = (v | (v >> 1)) & 0x3333333333333333
+    v = (v | (v >> 2)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v >> 4)) & 0x00FF00FF00FF00FF
+    v = (v | (v >> 8)) & 0x0000FFFF0000FFFF
+    return (v | (v >> 16)) & 0x00000000FFFFFFFF
+
+
+def interleave(x, y):
+    return _spread(x) | (_spread(y) << 1)
+
+
+def deinterleave(code):
+    return _compact(code), _compact(code >> 1)
+
+
+def cell(lat, lon):
+    """Returns the BASE_ZOOM cell of a position, or None if it is unknown."""
+    if lat is None or lon is None:
+        return None
+    return interleave(*tile_xy(lat, lon, BASE_ZOOM))
+
+
+def tile_range(z, x, y):
+    """Returns the inclusive (first, last) cells under tile z/x/y."""
+    shift = 2 * (BASE_ZOOM - z)
+    first = interleave(x, y) << shift
+    return first, first + (1 << shift) - 1
+
+
+def box_ranges(min_lat, min_lon, max_lat, max_lon, max_tiles=4):
+    """Inclusive cell ranges covering the box: those of the fewest tiles (at most max_tiles,
+    at the finest zoom that allows it), with adjacent ranges merged. A small superset of
+    the box, so callers still compare the exact coordinates."""
+    for z in range(BASE_ZOOM, -1, -1):
+        x0, y0 = tile_xy(max_lat, min_lon, z) # Top-left
+        x1, y1 = tile_xy(min_lat, max_lon, z) # Bottom-right
+        if (x1 - x0 + 1) * (y1 - y0 + 1) <= max_tiles:
+            break
+    ranges = []
+    for first, last in sorted(tile_range(z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)):
+        if ranges and ranges[-1][1] + 1 == first:
+            ranges[-1] = (ranges[-1][0], last)
+        else:
+            ranges.append((first, last))
+    return ranges
+
+
+def bin_zoom(z):
+    """Zoom level of the bins a tile at `z` is split into."""
+    return min(z + BIN_LEVELS, BASE_ZOOM)
+
+
+def bin_shift(z):
+    """Right shift that turns a cell into its bin for a tile at `z`."""
+    return 2 * (BASE_ZOOM - bin_zoom(z))
+
+
+def bin_index(z, x, y, code):
+    """Row-major position, within tile z/x/y, of a bin code produced with bin_shift(z)."""
+    levels = bin_zoom(z) - z
+    bx, by = deinterleave(code)
+    return ((by - (y << levels)) << levels) + (bx - (x << levels))
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= BASE_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)
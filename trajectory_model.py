@@ -0,0 +1,123 @@
+import logging
+import os
+from datetime import datetime
+
+import numpy as np
+
+import logs
+from geo import haversine_np
+
+FEATURE_NAMES = ['mean_speed_kmh', 'max_speed_kmh', 'mean_heading_change', 'dwell_seconds', 'safe_zone_distance_km']
+DWELL_RADIUS_KM = 0.05        # Moves shorter than this between fixes count as standing still
+MIN_MOVE_FOR_HEADING_KM = 0.01 # Ignore GPS jitter when measuring turns
+SAFE_ZONE_SCORE = 80           # Zones scoring above this are considered safe
+DISTANCE_CHUNK = 4096          # Tourists per block when measuring distance to every safe zone
+
+log = logs.get_logger('trajectory_model')
+
+
+def build_features(tourist_ids, timestamps, latitudes, longitudes, safe_lats, safe_lons, safe_radii, min_pings=1):
+    """Builds one feature row per tourist from their pings, without a Python loop over tourists.
+
+    tourist_ids, timestamps (epoch seconds), latitudes and longitudes are parallel arrays
+    sorted by (tourist_id, timestamp). safe_* describe the safe zones. Returns
+    (ids, features) where features has one column per FEATURE_NAMES entry, for the
+    tourists with at least min_pings pings.
+    """
+    tourist_ids = np.asarray(tourist_ids)
+    t = np.asarray(timestamps, dtype=float)
+    lat = np.asarray(latitudes, dtype=float)
+    lon = np.asarray(longitudes, dtype=float)
+    if not tourist_ids.size:
+        return tourist_ids, np.empty((0, len(FEATURE_NAMES)))
+
+    is_start = np.r_[True, tourist_ids[1:] != tourist_ids[:-1]]
+    group = np.cumsum(is_start) - 1
+    ids = tourist_ids[is_start]
+    n = ids.size
+    last = np.r_[np.flatnonzero(is_start)[1:] - 1, tourist_ids.size - 1]
+
+    # Segments between consecutive pings of the same tourist
+    same = ~is_start[1:]
+    seg_group = group[1:][same]
+    dist = haversine_np(lat[:-1], lon[:-1], lat[1:], lon[1:])[same]
+    dt = np.diff(t)[same]
+    total_dist = np.bincount(seg_group, weights=dist, minlength=n)
+    total_time = np.bincount(seg_group, weights=dt, minlength=n)
+    mean_speed = np.divide(total_dist * 3600, total_time, out=np.zeros(n), where=total_time > 0)
+    speed = dist * 3600 / np.maximum(dt, 1.0)
+    max_speed = np.zeros(n)
+    np.maximum.at(max_speed, seg_group, speed)
+    dwell = np.bincount(seg_group, weights=np.where(dist < DWELL_RADIUS_KM, dt, 0.0), minlength=n)
+
+    # Turn angle between consecutive moving segments of the same tourist
+    lat1, lat2 = np.radians(lat[:-1][same]), np.radians(lat[1:][same])
+    dlon = np.radians(lon[1:][same] - lon[:-1][same])
+    bearing = np.arctan2(np.sin(dlon) * np.cos(lat2), np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon))
+    turn_valid = (seg_group[1:] == seg_group[:-1]) & (dist[1:] > MIN_MOVE_FOR_HEADING_KM) & (dist[:-1] > MIN_MOVE_FOR_HEADING_KM)
+    turn = np.abs((np.diff(bearing) + np.pi) % (2 * np.pi) - np.pi)[turn_valid]
+    turn_group = seg_group[1:][turn_valid]
+    turn_count = np.bincount(turn_group, minlength=n)
+    turn_sum = np.bincount(turn_group, weights=turn, minlength=n)
+    mean_turn = np.divide(turn_sum, turn_count, out=np.zeros(n), where=turn_count > 0)
+
+    keep = np.bincount(group, minlength=n) >= min_pings
+    last = last[keep]
+    safe_distance = nearest_zone_distance(lat[last], lon[last], safe_lats, safe_lons, safe_radii)
+    features = np.column_stack([mean_speed[keep], max_speed[keep], mean_turn[keep], dwell[keep], safe_distance])
+    return ids[keep], features
+
+
+def nearest_zone_distance(lats, lons, zone_lats, zone_lons, zone_radii):
+    """Distance in km from each point to the edge of the nearest zone (0 inside a zone)."""
+    zone_lats, zone_lons, zone_radii = (np.asarray(a, dtype=float) for a in (zone_lats, zone_lons, zone_radii))
+    if not zone_lats.size:
+        return np.zeros(len(lats))
+    result = np.empty(len(lats))
+    for start in range(0, len(lats), DISTANCE_CHUNK):
+        block = slice(start, start + DISTANCE_CHUNK)
+        d = haversine_np(lats[block, None], lons[block, None], zone_lats[None, :], zone_lons[None, :])
+        result[block] = np.maximum(d - zone_radii[None, :], 0).min(axis=1)
+    return result
+
+
+class TrajectoryModel:
+    """IsolationForest over trajectory features, persisted to disk and loaded once per process."""
+
+    def __init__(self, path, contamination=0.01, random_state=42):
+        self.path = path
+        self.contamination = contamination
+        self.random_state = random_state
+        self.forest = None
+        self.fitted_at = None
+
+    @property
+    def is_fitted(self):
+        return self.forest is not None
+
+    # joblib and scikit-learn take over a second to import, so they are only loaded when a
+    # model is actually read or fitted, never when the app starts
+    def load(self):
+        """Loads a previously saved model. Returns False if none exists or it does not match."""
+        if not os.path.exists(self.path):
+            return False
+        import joblib
+        saved = joblib.load(self.path)
+        if saved.get('features') != FEATURE_NAMES:
+            logs.log_event(log, logging.WARNING, 'trajectory_model_ignored', path=self.path,
+                           reason='trained on different features')
+            return False
+        self.forest, self.fitted_at = saved['forest'], saved['fitted_at']
+        return True
+
+    def fit(self, features):
+        import joblib
+        from sklearn.ensemble import IsolationForest
+        forest = IsolationForest(n_estimators=100, contamination=self.contamination, random_state=self.random_state, n_jobs=-1)
+        forest.fit(features)
+        self.forest, self.fitted_at = forest, datetime.utcnow()
+        joblib.dump({'forest': forest, 'features': FEATURE_NAMES, 'fitted_at': self.fitted_at}, self.path)
+
+    def decision_function(self, features):
+        """Scores every row in one call; negative scores are outliers."""
+        return self.forest.decision_function(features)
@@ -1,12 +1,32 @@
+import socket
 import threading
+import time
 from kivy.utils import platform
 
-# --- IMPORT YOUR FLASK APP'S RUN FUNCTION ---
-from app import run_server 
+SERVER_PORT = 5000
+STARTUP_TIMEOUT = 60 # Seconds to wait for the server before loading the page anyway
+
+LOADING_HTML = '<html><body style="font-family:sans-serif;text-align:center;padding-top:40vh">Starting Smart Tourist Safety...</body></html>'
 
 # --- Start Flask server in a single background thread ---
-# This now runs only once when the script starts.
-server_thread = threading.Thread(target=run_server, daemon=True)
+# The app is imported inside the thread, so the window appears while Flask,
+# SQLAlchemy and NumPy load and the database is prepared.
+def start_server():
+    from app import run_server
+    run_server()
+
+def wait_for_server(timeout=STARTUP_TIMEOUT):
+    """Blocks until the local server accepts connections. Returns False on timeout."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', SERVER_PORT), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+server_thread = threading.Thread(target=start_server, daemon=True)
 server_thread.start()
 
 # --- Main Execution Block ---
@@ -17,13 +37,19 @@ if __name__ == '__main__':
         import webview
         # The server is already running in the background thread.
         # We just need to create the window.
-        url = 'http://127.0.0.1:5000' 
-        webview.create_window('Smart Tourist Safety', url)
-        webview.start()
+        url = f'http://127.0.0.1:{SERVER_PORT}'
+        window = webview.create_window('Smart Tourist Safety', html=LOADING_HTML)
+
+        def load_when_ready():
+            wait_for_server()
+            window.load_url(url)
+
+        webview.start(load_when_ready)
     
     # --- On Android, run the Kivy App ---
     elif platform == 'android':
         from kivy.app import App
+        from kivy.clock import Clock
         from kivy.uix.label import Label
         from kivy.core.window import Window
         
@@ -34,6 +60,11 @@ if __name__ == '__main__':
             Activity = autoclass('org.kivy.android.PythonActivity')
         except (ImportError, JavaException):
             WebView = None # Will be None if not on Android
+        try:
+            # Android views may only be touched from the Android UI thread, not Kivy's
+            from android.runnable import run_on_ui_thread
+        except ImportError:
+            run_on_ui_thread = lambda f: f
 
         class WebApp(App):
             def build(self):
@@ -41,20 +72,36 @@ if __name__ == '__main__':
                 self.url = 'http://10.0.2.2:5000' 
                 
                 if WebView:
-                    self.activity = Activity.mActivity
-                    self.webview = WebView(self.activity)
-                    self.webview.setWebViewClient(WebViewClient())
-                    self.webview.getSettings().setJavaScriptEnabled(True)
-                    Window.bind(on_resize=self.on_window_resize)
-                    self.activity.setContentView(self.webview)
-                    self.webview.loadUrl(self.url)
-                    # This Kivy Label is just a placeholder; the native WebView is what you'll see.
-                    return Label(text="Loading WebView...") 
+                    # build() runs on Kivy's main thread, so the wait for the server happens in the
+                    # background and the placeholder stays responsive until the WebView replaces it
+                    threading.Thread(target=self.wait_then_show, daemon=True).start()
+                    return Label(text="Starting Smart Tourist Safety...")
                 
                 return Label(text="This app is intended for Android.")
 
+            def wait_then_show(self):
+                wait_for_server()
+                Clock.schedule_once(self.show_webview)
+
+            def show_webview(self, dt):
+                Window.bind(on_resize=self.on_window_resize)
+                self.create_webview()
+
+            @run_on_ui_thread
+            def create_webview(self):
+                self.activity = Activity.mActivity
+                self.webview = WebView(self.activity)
+                self.webview.setWebViewClient(WebViewClient())
+                self.webview.getSettings().setJavaScriptEnabled(True)
+                self.activity.setContentView(self.webview)
+                self.webview.loadUrl(self.url)
+
             def on_window_resize(self, window, width, height):
                 if hasattr(self, 'webview'):
-                    self.webview.layout(0, 0, width, height)
+                    self.resize_webview(width, height)
+
+            @run_on_ui_thread
+            def resize_webview(self, width, height):
+                self.webview.layout(0, 0, width, height)
 
         WebApp().run()
\ No newline at end of file
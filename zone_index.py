@@ -0,0 +1,181 @@
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+from itertools import chain
+from math import floor
+
+import numpy as np
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session
+
+from database import db, SafetyZone, CacheVersion
+from geo import within_radius, bounding_box
+
+# Lightweight, session-independent copy of a SafetyZone row
+ZoneEntry = namedtuple('ZoneEntry', ['id', 'name', 'latitude', 'longitude', 'radius', 'regional_score'])
+
+DEFAULT_CELL_SIZE = 0.5 # Grid cell size in degrees (~55 km of latitude)
+REVALIDATE_INTERVAL = 5.0 # Seconds a process trusts its snapshot before re-reading the version counter
+VERSION_NAME = 'safety_zones'
+
+_NO_ZONES = np.empty(0, dtype=np.intp)
+
+
+class ZoneGridIndex:
+    """Immutable snapshot of the safety zones, bucketed into a fixed lat/lon grid so a point
+    lookup only checks nearby zones.
+
+    Every zone is registered in each cell its bounding box overlaps, so the zones
+    listed in a point's cell are a superset of the zones whose circle contains it.
+    Zone attributes are kept as parallel read-only NumPy arrays and each cell holds an
+    array of positions into them, so the exact distance check is one vectorized call.
+    The /api/safety_zones body is serialized (and gzipped) once per snapshot; `etag`
+    is a hash of that body and `version` the CacheVersion counter it was built from.
+    """
+
+    def __init__(self, zones, cell_size=DEFAULT_CELL_SIZE, version=0):
+        self.cell_size = cell_size
+        self.columns = int(round(360 / cell_size))
+        self.version = version
+        self.zones = tuple(zones)
+        self.latitudes = _frozen([z.latitude for z in self.zones], float)
+        self.longitudes = _frozen([z.longitude for z in self.zones], float)
+        self.radii = _frozen([z.radius for z in self.zones], float)
+        self.scores = _frozen([z.regional_score for z in self.zones], int)
+
+        self.json_body = json.dumps({'safety_zones': [
+            {'name': z.name, 'latitude': z.latitude, 'longitude': z.longitude, 'radius': z.radius, 'regional_score': z.regional_score}
+            for z in self.zones
+        ]}, sort_keys=True, separators=(',', ':')).encode()
+        self.gzip_body = gzip.compress(self.json_body, mtime=0)
+        self.etag = hashlib.sha1(self.json_body).hexdigest()
+
+        cells = {}
+        for i, zone in enumerate(self.zones):
+            min_lat, min_lon, max_lat, max_lon = bounding_box(zone.latitude, zone.longitude, zone.radius)
+            row_start, row_end = self._row(min_lat), self._row(max_lat)
+            col_start, col_end = self._col(min_lon), self._col(max_lon)
+            col_span = min(col_end - col_start, self.columns - 1)
+            for row in range(row_start, row_end + 1):
+                for col in range(col_start, col_start + col_span + 1):
+                    cells.setdefault((row, col % self.columns), []).append(i)
+        self.cells = {key: _frozen(members, np.intp) for key, members in cells.items()}
+
+    def _row(self, lat):
+        return floor(lat / self.cell_size)
+
+    def _col(self, lon):
+        return floor(lon / self.cell_size)
+
+    def __len__(self):
+        return len(self.zones)
+
+    def candidates(self, lat, lon):
+        """Returns positions of the zones whose bounding box may contain the point (no distance check)."""
+        return self.cells.get((self._row(lat), self._col(lon) % self.columns), _NO_ZONES)
+
+    def containing_indices(self, lat, lon, candidates=None):
+        """Returns positions (into self.zones and the attribute arrays) of the zones containing the point.
+
+        Pass candidates when the caller already has them from candidates(lat, lon).
+        """
+        if candidates is None:
+            candidates = self.candidates(lat, lon)
+        if not candidates.size:
+            return candidates
+        mask = within_radius(lat, lon, self.latitudes[candidates], self.longitudes[candidates], self.radii[candidates])
+        return candidates[mask]
+
+    def containing(self, lat, lon):
+        """Returns the zones whose circle contains the point."""
+        return [self.zones[i] for i in self.containing_indices(lat, lon)]
+
+
+def _frozen(values, dtype):
+    array = np.array(values, dtype=dtype)
+    array.setflags(write=False)
+    return array
+
+
+# --- Process-wide snapshot, rebuilt lazily after SafetyZone writes ---
+# Each process keeps its own snapshot. Zone writes bump the safety_zones CacheVersion
+# row in the same transaction; other processes compare against it at most every
+# REVALIDATE_INTERVAL seconds (one primary-key read) and rebuild when it moved.
+_index = None
+_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def invalidate():
+    """Records a zone change made outside the ORM hooks (e.g. bulk inserts) for every process.
+
+    Must be called inside an application context, after the change has committed.
+    """
+    with db.engine.begin() as conn:
+        _bump_version(conn)
+    _forget()
+
+
+def _forget():
+    global _index
+    _index = None
+
+
+def current_version():
+    return db.session.query(CacheVersion.version).filter(CacheVersion.name == VERSION_NAME).scalar() or 0
+
+
+def get_index():
+    """Returns the current zone snapshot, rebuilding it from the SafetyZone table if it changed.
+
+    Must be called inside an application context.
+    """
+    global _index, _checked_at
+    index = _index
+    if index is not None and time.monotonic() - _checked_at < REVALIDATE_INTERVAL:
+        return index
+    with _index_lock:
+        index = _index
+        if index is not None and time.monotonic() - _checked_at < REVALIDATE_INTERVAL:
+            return index
+        version = current_version()
+        if index is None or index.version != version:
+            rows = SafetyZone.query.with_entities(
+                SafetyZone.id, SafetyZone.name, SafetyZone.latitude,
+                SafetyZone.longitude, SafetyZone.radius, SafetyZone.regional_score,
+            ).order_by(SafetyZone.id).all()
+            index = _index = ZoneGridIndex((ZoneEntry(*row) for row in rows), version=version)
+        _checked_at = time.monotonic()
+    return index
+
+
+def _bump_version(conn):
+    bumped = conn.execute(update(CacheVersion).where(CacheVersion.name == VERSION_NAME).values(
+        version=CacheVersion.version + 1)).rowcount
+    if not bumped:
+        conn.execute(insert(CacheVersion).values(name=VERSION_NAME, version=1))
+
+
+# The version is bumped inside the writing transaction; the local snapshot is only
+# dropped once that transaction commits, since the change is invisible until then.
+# Bulk operations bypass these hooks; call invalidate() after them.
+@event.listens_for(Session, 'after_flush')
+def _track_zone_writes(session, flush_context):
+    changed = chain(session.new, session.dirty, session.deleted)
+    if any(isinstance(obj, SafetyZone) for obj in changed) and not session.info.get('safety_zones_changed'):
+        _bump_version(session.connection())
+        session.info['safety_zones_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _zone_writes_committed(session):
+    if session.info.pop('safety_zones_changed', False):
+        _forget()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _zone_writes_rolled_back(session):
+    session.info.pop('safety_zones_changed', None)